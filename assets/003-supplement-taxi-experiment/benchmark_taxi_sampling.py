@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the efficient taxi sampling experiment
+
+Builds synthetic SQLite taxi databases with the payment_type mix from
+population_parameters.csv, then measures EfficientTaxiSamplingExperiment on
+them: extraction throughput (head, reservoir and histogram modes), population
+statistics, simulation throughput per sample size and peak memory. Every case
+runs in a fresh process, so each peak RSS belongs to that case alone.
+
+    python benchmark_taxi_sampling.py --rows 1000000 10000000 --output bench.json
+    python benchmark_taxi_sampling.py --rows 1000000 --compare bench.json
+
+Fixtures are built once and reused from --fixture-dir. With --compare, cases
+that got slower (or bigger) than the baseline file by more than --threshold
+are listed and the exit status is 1.
+"""
+
+import numpy as np
+import os
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PARAMETERS_CSV = os.path.join(HERE, 'population_parameters.csv')
+
+FIXTURE_TABLE = 'tripdata'
+FIXTURE_CHUNK_ROWS = 500000
+
+EXTRACT_CASES = {
+    'extract_head': {'population_mode': 'rows', 'sampling': 'head'},
+    'extract_reservoir': {'population_mode': 'rows', 'sampling': 'reservoir'},
+    'extract_histogram': {'population_mode': 'histogram'},
+}
+
+# Metrics compared against a baseline; all are lower-is-better
+COMPARED_METRICS = ['seconds', 'peak_rss_mb']
+
+def load_payment_mix(path=PARAMETERS_CSV):
+    """(payment types, probabilities) from the population parameters CSV"""
+    import csv
+    types, counts = [], []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            if row['Payment_Type'] == 'Total':
+                continue
+            types.append(float(row['Payment_Type']))
+            counts.append(int(row['Count']))
+    counts = np.array(counts, dtype=np.float64)
+    return np.array(types), counts / counts.sum()
+
+def build_fixture(fixture_dir, n_rows, seed=0, payment_mix=None):
+    """Directory holding one synthetic taxi SQLite file of n_rows trips; built once, then reused.
+
+    The table carries a few numeric trip columns next to payment_type so scans
+    read realistic row widths. The file is written under a temporary name and
+    renamed when complete, so an interrupted build is never mistaken for a fixture.
+    """
+    import sqlite3
+
+    dataset_dir = os.path.join(fixture_dir, f"taxi_{n_rows}_seed{seed}")
+    path = os.path.join(dataset_dir, 'taxi.sqlite')
+    if os.path.exists(path):
+        return dataset_dir
+
+    types, probabilities = payment_mix if payment_mix is not None else load_payment_mix()
+    os.makedirs(dataset_dir, exist_ok=True)
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    print(f"🏗️ Building fixture with {n_rows:,} rows: {path}")
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(f"CREATE TABLE {FIXTURE_TABLE} (vendorid INTEGER, passenger_count INTEGER, "
+                     f"trip_distance REAL, payment_type REAL, total_amount REAL)")
+        for offset in range(0, n_rows, FIXTURE_CHUNK_ROWS):
+            n = min(FIXTURE_CHUNK_ROWS, n_rows - offset)
+            columns = (
+                rng.integers(1, 3, size=n).tolist(),
+                rng.integers(1, 7, size=n).tolist(),
+                np.round(rng.exponential(3.0, size=n), 2).tolist(),
+                types[rng.choice(len(types), size=n, p=probabilities)].tolist(),
+                np.round(rng.gamma(2.0, 9.0, size=n), 2).tolist(),
+            )
+            conn.executemany(f"INSERT INTO {FIXTURE_TABLE} VALUES (?, ?, ?, ?, ?)", zip(*columns))
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    print(f"✅ Fixture built in {time.perf_counter() - start:.1f}s ({os.path.getsize(path) / 1024 ** 2:,.0f} MB)")
+    return dataset_dir
+
+def _stage(metrics, name):
+    return next((stage for stage in metrics['stages'] if stage['stage'] == name), {})
+
+def _run_case(case):
+    """Run one benchmark case in the current process and summarize it"""
+    from efficient_taxi_sampling import EfficientTaxiSamplingExperiment, _peak_rss_mb
+
+    baseline_rss, _ = _peak_rss_mb()
+    options = {
+        'dataset_path': case['dataset_path'],
+        'max_records': case['max_records'],
+        'seed': case['seed'],
+        'chunk_size': case['chunk_size'],
+        'workers': case['workers'],
+        'detailed_csv_path': None,
+        'verbose': 0,
+    }
+    if case['name'] == 'simulate':
+        options.update(population_mode='rows', sampling='head', streaming_stats=case['streaming_stats'])
+    else:
+        options.update(EXTRACT_CASES[case['name']])
+    experiment = EfficientTaxiSamplingExperiment(**options)
+
+    start = time.perf_counter()
+    if experiment.extract_payment_data_efficiently() is None:
+        raise RuntimeError(f"Extraction failed for {case['dataset_path']}")
+    seconds = time.perf_counter() - start
+
+    summary = {'case': case['name'], 'rows': case['rows']}
+    if case['name'] == 'simulate':
+        experiment.sample_sizes = case['sample_sizes']
+        experiment.n_simulations = case['n_simulations']
+        start = time.perf_counter()
+        if not experiment.run_sampling_simulation():
+            raise RuntimeError("Simulation produced no results")
+        seconds = time.perf_counter() - start
+        simulate = _stage(experiment.metrics.to_dict(), 'simulate')
+        summary.update(
+            simulations=simulate.get('simulations'),
+            simulations_per_sec=simulate.get('simulations_per_sec'),
+            sample_sizes=simulate.get('sample_sizes'),
+        )
+    else:
+        metrics = experiment.metrics.to_dict()
+        extract = _stage(metrics, 'sql_extract')
+        population_stats = _stage(metrics, 'population_stats')
+        summary.update(
+            rows_scanned=extract.get('rows'),
+            rows_per_sec=extract.get('rows_per_sec'),
+            population_stats_seconds=population_stats.get('seconds'),
+            population_records=int(experiment.payment_counts.sum()),
+        )
+
+    peak_rss, peak_children = _peak_rss_mb()
+    summary.update(
+        seconds=seconds,
+        baseline_rss_mb=baseline_rss,
+        peak_rss_mb=peak_rss,
+        peak_rss_children_mb=peak_children,
+        stages=experiment.metrics.stages,
+    )
+    return summary
+
+def run_case_isolated(case):
+    """Run a case in a freshly spawned interpreter so its peak RSS is not inherited"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_run_case, case).result()
+
+def run_benchmarks(rows_list, fixture_dir, max_records=1000000, sample_sizes=None, n_simulations=1000,
+                   workers=1, streaming_stats=False, chunk_size=100000, repeat=1, seed=0, cases=None):
+    """Build fixtures and run every case per fixture size; each case keeps its fastest of `repeat` runs"""
+    from efficient_taxi_sampling import EfficientTaxiSamplingExperiment
+
+    cases = cases or list(EXTRACT_CASES) + ['simulate']
+    sample_sizes = sample_sizes or EfficientTaxiSamplingExperiment().sample_sizes
+    payment_mix = load_payment_mix()
+    results = []
+    for n_rows in rows_list:
+        dataset_path = build_fixture(fixture_dir, n_rows, seed=seed, payment_mix=payment_mix)
+        for name in cases:
+            case = {
+                'name': name,
+                'rows': n_rows,
+                'dataset_path': dataset_path,
+                'max_records': max_records,
+                'seed': seed,
+                'chunk_size': chunk_size,
+                'workers': workers,
+                'streaming_stats': streaming_stats,
+                'sample_sizes': sample_sizes,
+                'n_simulations': n_simulations,
+            }
+            runs = [run_case_isolated(case) for _ in range(repeat)]
+            best = min(runs, key=lambda run: run['seconds'])
+            best['repeat_seconds'] = [run['seconds'] for run in runs]
+            results.append(best)
+
+            throughput = (f"{best['rows_per_sec']:,.0f} rows/s" if best.get('rows_per_sec')
+                          else f"{best['simulations_per_sec']:,.0f} simulations/s" if best.get('simulations_per_sec')
+                          else "")
+            print(f"⏱️ {name:<18} {n_rows:>12,} rows  {best['seconds']:8.3f}s  "
+                  f"peak {best['peak_rss_mb'] or 0:8.1f} MB  {throughput}")
+    return results
+
+def environment_info():
+    """Interpreter, library and checkout details recorded with every results file"""
+    import platform
+    import subprocess
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': commit,
+    }
+
+def compare_results(current, baseline, threshold=0.25):
+    """Cases whose compared metrics grew by more than threshold (a fraction) over the baseline run"""
+    baseline_cases = {(result['case'], result['rows']): result for result in baseline['results']}
+    regressions = []
+    print(f"\n📊 Comparison with baseline ({baseline['environment'].get('git_commit')}):")
+    print(f"{'Case':<18} {'Rows':>12} {'Metric':<12} {'Baseline':>10} {'Current':>10} {'Ratio':>7}")
+    print("-" * 74)
+    for result in current['results']:
+        previous = baseline_cases.get((result['case'], result['rows']))
+        if previous is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            flag = " ⚠️" if ratio > 1 + threshold else ""
+            print(f"{result['case']:<18} {result['rows']:>12,} {metric:<12} {old:>10.3f} {new:>10.3f} {ratio:>6.2f}x{flag}")
+            if flag:
+                regressions.append({'case': result['case'], 'rows': result['rows'], 'metric': metric,
+                                    'baseline': old, 'current': new, 'ratio': ratio})
+    return regressions
+
+def main(argv=None):
+    import argparse
+    import json
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the taxi sampling experiment")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000],
+                        help="fixture sizes in rows (e.g. 1000000 10000000 100000000)")
+    parser.add_argument('--fixture-dir', default=os.path.join(tempfile.gettempdir(), 'taxi_benchmark_fixtures'))
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--cases', nargs='+', choices=list(EXTRACT_CASES) + ['simulate'])
+    parser.add_argument('--max-records', type=int, default=1000000)
+    parser.add_argument('--sample-sizes', type=int, nargs='+')
+    parser.add_argument('--n-simulations', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--streaming-stats', action='store_true')
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=1, help="runs per case; the fastest is kept")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', help="baseline results JSON to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="allowed growth over the baseline, as a fraction")
+    args = parser.parse_args(argv)
+
+    print("🏁 Taxi sampling benchmark suite")
+    started = time.time()
+    results = run_benchmarks(
+        args.rows, args.fixture_dir, max_records=args.max_records, sample_sizes=args.sample_sizes,
+        n_simulations=args.n_simulations, workers=args.workers, streaming_stats=args.streaming_stats,
+        chunk_size=args.chunk_size, repeat=args.repeat, seed=args.seed, cases=args.cases,
+    )
+    report = {
+        'created': started,
+        'environment': environment_info(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': results,
+    }
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report['regressions'] = compare_results(report, baseline, args.threshold)
+        if report['regressions']:
+            print(f"\n⚠️ {len(report['regressions'])} regression(s) beyond {args.threshold:.0%}")
+            status = 1
+        else:
+            print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=float)
+    print(f"💾 Benchmark results saved as '{args.output}'")
+    return status
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,159 +2,1088 @@
 """
 Efficient NYC Taxi Data Sampling Experiment
 Uses real data with minimal memory footprint - only payment_type column
+
+Run without arguments for the full experiment, or one stage at a time:
+
+    python efficient_taxi_sampling.py extract  --workdir taxi_artifacts
+    python efficient_taxi_sampling.py simulate --workdir taxi_artifacts --seed 42
+    python efficient_taxi_sampling.py report   --workdir taxi_artifacts
+    python efficient_taxi_sampling.py plot     --workdir taxi_artifacts
+
+Each stage writes a compact artifact to the work directory that the next one
+reuses. pandas, plotly and kagglehub are imported only by the stages that need them.
 """
 
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import kagglehub
+import functools
+import os
+import time
 import warnings
+from contextlib import contextmanager
 warnings.filterwarnings('ignore')
 
-plt.style.use('seaborn-v0_8')
-sns.set_palette("husl")
+DATASET_HANDLE = "dhruvildave/new-york-city-taxi-trips-2019"
+
+# spawn_key prefix for extraction streams; never a sample size, so never collides with simulation blocks
+EXTRACT_STREAM_KEY = 2 ** 32 - 1
+
+# Upper bound on index-block elements (simulations x sample size) drawn at once
+MAX_BLOCK_ELEMENTS = 2 ** 23
+
+# Per-size statistics shared by every method
+SUMMARY_KEYS = ['cash_mean', 'cash_std', 'cash_ci_lower', 'cash_ci_upper', 'card_mean', 'card_std',
+                'card_ci_lower', 'card_ci_upper', 'mean_absolute_error', 'rmse']
+
+DETAILED_CSV_COLUMNS = ['Sample_Size', 'Simulation_Number', 'Cash_Percentage',
+                        'Card_Percentage', 'Cash_Error', 'Card_Error']
+
+# Population handles for pool workers, set once per process by _init_worker
+_WORKER_POPULATION = {}
+
+def draw_sample_indices(rng, population_size, sample_size, n_draws):
+    """Draw n_draws simple random samples without replacement as an (n_draws, sample_size) index block"""
+    # Dense samples: rejection would keep colliding, so draw each row directly
+    if sample_size * 4 > population_size:
+        return np.stack([
+            rng.choice(population_size, size=sample_size, replace=False)
+            for _ in range(n_draws)
+        ])
+
+    # Sparse samples: draw with replacement, then redraw duplicates within each row.
+    # The redraw depends only on the multiset of indices, so every subset stays equally likely.
+    indices = rng.integers(0, population_size, size=(n_draws, sample_size))
+    while True:
+        indices.sort(axis=1)
+        duplicates = np.zeros(indices.shape, dtype=bool)
+        duplicates[:, 1:] = indices[:, 1:] == indices[:, :-1]
+        n_duplicates = int(duplicates.sum())
+        if n_duplicates == 0:
+            return indices
+        indices[duplicates] = rng.integers(0, population_size, size=n_duplicates)
+
+def draw_sample_counts(rng, sample_size, n_draws, payment_codes=None, payment_counts=None):
+    """Return an (n_draws, n_categories) matrix of payment-type counts per sample"""
+    if payment_codes is None:
+        # Histogram population: counts of a sample without replacement are multivariate hypergeometric
+        return rng.multivariate_hypergeometric(payment_counts, sample_size, size=n_draws)
+
+    n_categories = len(payment_counts)
+    codes = payment_codes[draw_sample_indices(rng, len(payment_codes), sample_size, n_draws)]
+    offsets = np.arange(n_draws)[:, None] * n_categories
+    counts = np.bincount((codes + offsets).ravel(), minlength=n_draws * n_categories)
+    return counts.reshape(n_draws, n_categories)
+
+def hypergeometric_pmf(population_size, successes, sample_size):
+    """Support and pmf of the number of successes in a sample drawn without replacement.
+
+    Built from the ratio p(k+1)/p(k) in log space, so it costs O(sample_size)
+    and stays stable for populations and samples in the millions.
+    """
+    failures = population_size - successes
+    k_min = max(0, sample_size - failures)
+    k_max = min(sample_size, successes)
+    support = np.arange(k_min, k_max + 1)
+    k = support[:-1].astype(float)
+    log_ratios = (np.log(successes - k) + np.log(sample_size - k)
+                  - np.log(k + 1) - np.log(failures - sample_size + k + 1))
+    log_pmf = np.concatenate([[0.0], np.cumsum(log_ratios)])
+    pmf = np.exp(log_pmf - log_pmf.max())
+    return support, pmf / pmf.sum()
+
+def _simulate_block(task, payment_codes, payment_counts):
+    """Run one (sample_size, block) task and return the count vector of each requested category"""
+    sample_size, block_index, n_draws, entropy, codes_of_interest = task
+    rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(sample_size, block_index)))
+    counts = draw_sample_counts(rng, sample_size, n_draws, payment_codes, payment_counts)
+    return [counts[:, code] if code is not None else np.zeros(n_draws, dtype=np.int64)
+            for code in codes_of_interest]
+
+def _init_worker(codes_path, payment_counts):
+    """Pool initializer: memory-map the shared population once per worker process"""
+    _WORKER_POPULATION['codes'] = np.load(codes_path, mmap_mode='r') if codes_path else None
+    _WORKER_POPULATION['counts'] = payment_counts
+
+def _simulate_block_in_worker(task):
+    return _simulate_block(task, _WORKER_POPULATION['codes'], _WORKER_POPULATION['counts'])
+
+def _peak_rss_mb():
+    """Peak resident set size of this process and of its reaped children, in MB"""
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None, None
+    import sys
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / scale / 1024,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024 / scale / 1024)
+
+class RunMetrics:
+    """Per-stage timings, peak memory and throughput for one experiment run.
+
+    Each stage records wall and CPU seconds, the process (and worker) peak RSS
+    after it ran, and rows/sec or simulations/sec when the stage reports a
+    'rows' or 'simulations' count. One stage can be captured with cProfile.
+    """
+
+    def __init__(self, profile_stage=None, profile_path=None):
+        self.profile_stage = profile_stage
+        self.profile_path = profile_path or (f"profile_{profile_stage}.prof" if profile_stage else None)
+        self.stages = []
+        self._open = []
+        self.started = time.time()
+
+    @property
+    def current(self):
+        """Record of the innermost running stage, for attaching counts"""
+        return self._open[-1] if self._open else {}
+
+    @contextmanager
+    def stage(self, name):
+        record = {'stage': name}
+        self._open.append(record)
+        profiler = None
+        if name == self.profile_stage:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        peak_before, _ = _peak_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - wall_start
+            record['cpu_seconds'] = time.process_time() - cpu_start
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(self.profile_path)
+                record['profile'] = self.profile_path
+            peak_after, peak_children = _peak_rss_mb()
+            if peak_after is not None:
+                record['peak_rss_mb'] = round(peak_after, 1)
+                record['peak_rss_growth_mb'] = round(peak_after - peak_before, 1)
+                record['peak_rss_children_mb'] = round(peak_children, 1)
+            for unit in ('rows', 'simulations'):
+                if unit in record and record['seconds'] > 0:
+                    record[f'{unit}_per_sec'] = record[unit] / record['seconds']
+            self._open.pop()
+            self.stages.append(record)
+
+    def to_dict(self):
+        peak_rss, peak_children = _peak_rss_mb()
+        return {
+            'started': self.started,
+            'total_seconds': time.time() - self.started,
+            'peak_rss_mb': peak_rss,
+            'peak_rss_children_mb': peak_children,
+            'stages': self.stages,
+        }
+
+    def write(self, path):
+        import json
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=float)
+        return path
+
+def timed_stage(name):
+    """Method decorator: run the call as a named stage of self.metrics"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+class RunningMoments:
+    """Mergeable running mean and variance (Welford updates, Chan et al. batch merges)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return self
+        batch = RunningMoments()
+        batch.count = len(values)
+        batch.mean = float(values.mean())
+        batch.m2 = float(((values - batch.mean) ** 2).sum())
+        return self.merge(batch)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def variance(self):
+        """Population variance (ddof=0), matching np.std's default"""
+        return self.m2 / self.count if self.count else float('nan')
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+
+class CountHistogram:
+    """Mergeable quantile sketch for per-sample category counts.
+
+    A sample of size n can only contain 0..n of a category, so a frequency table over
+    that lattice is a lossless sketch: percentiles equal np.percentile over the raw
+    draws, and memory grows with n, not with the number of simulations.
+    """
+
+    def __init__(self, sample_size):
+        self.frequencies = np.zeros(sample_size + 1, dtype=np.int64)
+
+    def update(self, counts):
+        self.frequencies += np.bincount(counts, minlength=len(self.frequencies))
+        return self
+
+    def merge(self, other):
+        self.frequencies += other.frequencies
+        return self
+
+    @property
+    def count(self):
+        return int(self.frequencies.sum())
+
+    def percentile(self, q):
+        """Linearly interpolated percentile of the counts, as np.percentile computes it"""
+        position = (self.count - 1) * q / 100
+        lower = int(np.floor(position))
+        cumulative = np.cumsum(self.frequencies)
+        lower_value = np.searchsorted(cumulative, lower, side='right')
+        upper_value = np.searchsorted(cumulative, min(lower + 1, self.count - 1), side='right')
+        return float(lower_value + (position - lower) * (upper_value - lower_value))
+
+def monte_carlo_errors(n_draws, std, central_m4, percentile):
+    """Approximate Monte Carlo standard errors of a reported SE and its 95% CI bounds.
+
+    The SE error uses the delta method on the sample variance, Var(s^2) ~ (mu4 - sigma^4) / m.
+    Each CI-bound error is half the distance between the quantiles one binomial standard
+    deviation, sqrt(p(1-p)/m), either side of p.
+    """
+    errors = {'se_mc_error': 0.0}
+    if std > 0:
+        errors['se_mc_error'] = float(np.sqrt(max(central_m4 - std ** 4, 0.0) / n_draws) / (2 * std))
+    for key, p in (('ci_lower_mc_error', 0.025), ('ci_upper_mc_error', 0.975)):
+        spread = np.sqrt(p * (1 - p) / n_draws)
+        upper = percentile(min(p + spread, 1.0) * 100)
+        lower = percentile(max(p - spread, 0.0) * 100)
+        errors[key] = float(upper - lower) / 2
+    return errors
+
+class SimulationStats:
+    """Per-sample-size statistics that keep every simulated estimate in memory"""
+
+    def __init__(self, sample_size, true_cash_pct, true_card_pct):
+        self.sample_size = sample_size
+        self.true_cash_pct = true_cash_pct
+        self.true_card_pct = true_card_pct
+        self.cash_blocks = []
+        self.card_blocks = []
+
+    @property
+    def count(self):
+        return sum(len(block) for block in self.cash_blocks)
+
+    def update(self, cash_counts, card_counts):
+        self.cash_blocks.append(cash_counts)
+        self.card_blocks.append(card_counts)
+
+    def monte_carlo_errors(self):
+        cash_percentages = np.concatenate(self.cash_blocks) / self.sample_size * 100
+        std = np.std(cash_percentages)
+        central_m4 = np.mean((cash_percentages - cash_percentages.mean()) ** 4)
+        return monte_carlo_errors(len(cash_percentages), std, central_m4,
+                                  lambda q: np.percentile(cash_percentages, q))
+
+    def summary(self):
+        cash_percentages = np.concatenate(self.cash_blocks) / self.sample_size * 100
+        card_percentages = np.concatenate(self.card_blocks) / self.sample_size * 100
+        cash_errors = cash_percentages - self.true_cash_pct
+        card_errors = card_percentages - self.true_card_pct
+
+        sample_results = [
+            {
+                'simulation': sim + 1,
+                'sample_size': self.sample_size,
+                'cash_percentage': cash_pct,
+                'card_percentage': card_pct,
+                'cash_error': cash_err,
+                'card_error': card_err
+            }
+            for sim, (cash_pct, card_pct, cash_err, card_err) in enumerate(zip(
+                cash_percentages.tolist(), card_percentages.tolist(),
+                cash_errors.tolist(), card_errors.tolist()))
+        ]
+
+        return {
+            'sample_results': sample_results,
+            'cash_mean': np.mean(cash_percentages),
+            'cash_std': np.std(cash_percentages),
+            'cash_ci_lower': np.percentile(cash_percentages, 2.5),
+            'cash_ci_upper': np.percentile(cash_percentages, 97.5),
+            'card_mean': np.mean(card_percentages),
+            'card_std': np.std(card_percentages),
+            'card_ci_lower': np.percentile(card_percentages, 2.5),
+            'card_ci_upper': np.percentile(card_percentages, 97.5),
+            'mean_absolute_error': np.mean(np.abs(cash_errors)),
+            'rmse': np.sqrt(np.mean(cash_errors**2))
+        }
+
+class StreamingSimulationStats:
+    """Per-sample-size statistics in constant memory with respect to the number of simulations.
+
+    Means, SE, MAE and RMSE come from running moments; the 2.5/97.5 CI bounds come
+    from count histograms. Individual estimates are not kept (sample_results is empty).
+    """
+
+    def __init__(self, sample_size, true_cash_pct, true_card_pct):
+        self.sample_size = sample_size
+        self.true_cash_pct = true_cash_pct
+        self.true_card_pct = true_card_pct
+        self.cash = RunningMoments()
+        self.card = RunningMoments()
+        self.cash_abs_error = RunningMoments()
+        self.cash_histogram = CountHistogram(sample_size)
+        self.card_histogram = CountHistogram(sample_size)
+
+    def update(self, cash_counts, card_counts):
+        cash_percentages = cash_counts / self.sample_size * 100
+        self.cash.update(cash_percentages)
+        self.card.update(card_counts / self.sample_size * 100)
+        self.cash_abs_error.update(np.abs(cash_percentages - self.true_cash_pct))
+        self.cash_histogram.update(cash_counts)
+        self.card_histogram.update(card_counts)
+
+    @property
+    def count(self):
+        return self.cash.count
+
+    def _percentile(self, histogram, q):
+        return histogram.percentile(q) / self.sample_size * 100
+
+    def monte_carlo_errors(self):
+        values = np.arange(self.sample_size + 1) / self.sample_size * 100
+        frequencies = self.cash_histogram.frequencies
+        central_m4 = float((frequencies * (values - self.cash.mean) ** 4).sum() / self.cash.count)
+        return monte_carlo_errors(self.cash.count, self.cash.std, central_m4,
+                                  lambda q: self._percentile(self.cash_histogram, q))
+
+    def summary(self):
+        cash_bias = self.cash.mean - self.true_cash_pct
+        return {
+            'sample_results': [],
+            'cash_mean': self.cash.mean,
+            'cash_std': self.cash.std,
+            'cash_ci_lower': self._percentile(self.cash_histogram, 2.5),
+            'cash_ci_upper': self._percentile(self.cash_histogram, 97.5),
+            'card_mean': self.card.mean,
+            'card_std': self.card.std,
+            'card_ci_lower': self._percentile(self.card_histogram, 2.5),
+            'card_ci_upper': self._percentile(self.card_histogram, 97.5),
+            'mean_absolute_error': self.cash_abs_error.mean,
+            'rmse': float(np.sqrt(self.cash.variance + cash_bias ** 2)),
+            'cash_count_histogram': self.cash_histogram.frequencies
+        }
+
+class ExtractCache:
+    """Persistent on-disk cache of payment extracts.
+
+    Each entry is a memory-mappable ``<key>.npy`` of payment codes (rows mode only)
+    plus a ``<key>.json`` holding the category mapping, counts, the query and the
+    source fingerprints. Entries are found by their request parameters and are only
+    valid while every source SQLite file keeps the same size, mtime and sampled hash.
+    The directory is kept under ``max_bytes`` by evicting least recently used entries.
+    """
+
+    HASH_BLOCK_BYTES = 1024 * 1024
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def fingerprint(cls, path):
+        """Size, mtime and a SHA-256 of the first and last blocks of a file"""
+        import hashlib
+        stat = os.stat(path)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            digest.update(f.read(cls.HASH_BLOCK_BYTES))
+            if stat.st_size > cls.HASH_BLOCK_BYTES:
+                f.seek(max(cls.HASH_BLOCK_BYTES, stat.st_size - cls.HASH_BLOCK_BYTES))
+                digest.update(f.read(cls.HASH_BLOCK_BYTES))
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+    def _path(self, key, suffix):
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def entries(self):
+        """All readable entry metadata in the cache directory"""
+        import json
+        entries = []
+        for name in sorted(os.listdir(self.cache_dir)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, name)) as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def _is_valid(self, entry, hashes=None):
+        """Sources unchanged: size and mtime first, then the sampled hash (memoised in hashes)"""
+        hashes = {} if hashes is None else hashes
+        for source in entry['sources']:
+            try:
+                stat = os.stat(source['path'])
+            except OSError:
+                return False
+            if stat.st_size != source['size'] or stat.st_mtime_ns != source['mtime_ns']:
+                return False
+            # Same size and mtime can still be new content (cp -p, rsync -t, touch -r)
+            if source['path'] not in hashes:
+                try:
+                    hashes[source['path']] = self.fingerprint(source['path'])['sha256']
+                except OSError:
+                    return False
+            if hashes[source['path']] != source.get('sha256'):
+                return False
+        return entry['has_codes'] is False or os.path.exists(self._path(entry['key'], '.npy'))
+
+    def lookup(self, request):
+        """Most recent valid entry for these request parameters, or None"""
+        hashes = {}
+        matches = [
+            entry for entry in self.entries()
+            if entry['request'] == request and self._is_valid(entry, hashes)
+        ]
+        if not matches:
+            return None
+        entry = max(matches, key=lambda e: e['created'])
+        self._touch(entry)
+        return entry
+
+    def load(self, entry):
+        """Return (codes or None, categories, counts); codes are memory-mapped read-only"""
+        codes = np.load(self._path(entry['key'], '.npy'), mmap_mode='r') if entry['has_codes'] else None
+        return codes, np.array(entry['categories']), np.array(entry['counts'], dtype=np.int64)
+
+    def store(self, request, source_paths, query, codes, categories, counts):
+        """Write an entry for an extract and apply the eviction policy"""
+        import hashlib
+        import json
+        import time
+
+        sources = [{'path': os.path.abspath(path), **self.fingerprint(path)} for path in source_paths]
+        key = hashlib.sha256(
+            json.dumps([request, query, sources], sort_keys=True).encode()
+        ).hexdigest()[:20]
+        entry = {
+            'key': key,
+            'request': request,
+            'query': query,
+            'sources': sources,
+            'categories': np.asarray(categories).tolist(),
+            'counts': np.asarray(counts).tolist(),
+            'has_codes': codes is not None,
+            'created': time.time(),
+            'last_used': time.time(),
+        }
+
+        if codes is not None:
+            tmp_path = self._path(key, '.npy.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(codes))
+            os.replace(tmp_path, self._path(key, '.npy'))
+        self._write_entry(entry)
+        self.evict(keep=key)
+        return entry
+
+    def _write_entry(self, entry):
+        import json
+        tmp_path = self._path(entry['key'], '.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(entry['key'], '.json'))
+
+    def _touch(self, entry):
+        import time
+        entry['last_used'] = time.time()
+        self._write_entry(entry)
+
+    def _entry_bytes(self, entry):
+        total = 0
+        for suffix in ('.npy', '.json'):
+            try:
+                total += os.path.getsize(self._path(entry['key'], suffix))
+            except OSError:
+                pass
+        return total
+
+    def remove(self, key):
+        for suffix in ('.npy', '.json'):
+            try:
+                os.remove(self._path(key, suffix))
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self, request=None):
+        """Remove entries matching request (all entries if None); returns the number removed"""
+        removed = 0
+        for entry in self.entries():
+            if request is None or entry['request'] == request:
+                self.remove(entry['key'])
+                removed += 1
+        return removed
+
+    def evict(self, keep=None):
+        """Drop stale entries, then least recently used ones until the cache fits in max_bytes"""
+        entries, hashes = [], {}
+        for entry in self.entries():
+            if self._is_valid(entry, hashes):
+                entries.append(entry)
+            else:
+                self.remove(entry['key'])
+
+        total = sum(self._entry_bytes(entry) for entry in entries)
+        for entry in sorted(entries, key=lambda e: e['last_used']):
+            if total <= self.max_bytes:
+                break
+            if entry['key'] == keep:
+                continue
+            total -= self._entry_bytes(entry)
+            self.remove(entry['key'])
+        return total
 
 class EfficientTaxiSamplingExperiment:
-    def __init__(self, max_records=1000000):
+    def __init__(self, max_records=1000000, seed=None, batch_size=1000,
+                 sampling='head', chunk_size=100000, population_mode='rows', workers=1,
+                 cache_dir=None, cache_max_bytes=2 * 1024 ** 3, refresh_cache=False,
+                 streaming_stats=False, detailed_csv_path='hundred_samples_detailed.csv',
+                 tolerance=None, max_simulations_per_size=100000, method='monte_carlo', cross_check=False,
+                 sources='first', extract_workers=4, dataset_path=None,
+                 verbose=2, metrics_path=None, profile_stage=None, profile_path=None):
         self.max_records = max_records
-        self.payment_data = None
+        self.population_mode = population_mode  # 'rows' = coded array, 'histogram' = category counts only
+        self.sampling = sampling  # 'head' = first rows in storage order, 'reservoir' = uniform over table
+        self.chunk_size = chunk_size
+        self.sources = sources  # 'first' = first file and table only, 'all' = every matching table in every file
+        self.extract_workers = extract_workers
+        self.dataset_path = dataset_path  # local directory of .sqlite files; None downloads the Kaggle dataset
+        self.extraction_report = None
+        self._payment_data = None
+        self.payment_codes = None
+        self.payment_categories = None
+        self.payment_counts = None
         self.population_stats = None
         self.sample_sizes = [30, 100, 300, 500, 1000, 2000, 5000]
         self.n_simulations = 100
+        self.batch_size = batch_size
+        self.workers = workers
+        self.streaming_stats = streaming_stats  # constant-memory statistics, no per-simulation records
+        self.detailed_csv_path = detailed_csv_path  # None skips the per-simulation CSV
+        # Adaptive budget: with a tolerance (percentage points), each size keeps doubling its
+        # simulations until the Monte Carlo error of its SE and CI bounds is within tolerance
+        self.tolerance = tolerance
+        self.max_simulations_per_size = max_simulations_per_size
+        # 'exact' derives every statistic from the hypergeometric pmf; cross_check adds a Monte Carlo run
+        self.method = method
+        self.cross_check = cross_check
+        self.seed = seed
+        # Root of every random stream; its entropy is recorded so unseeded runs can be replayed
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
+        self.cache = ExtractCache(cache_dir, max_bytes=cache_max_bytes) if cache_dir else None
+        self.refresh_cache = refresh_cache
+        # verbose: 0 = errors only, 1 = stage progress, 2 = full per-size and per-source detail
+        self.verbose = verbose
+        self.metrics_path = metrics_path
+        self.metrics = RunMetrics(profile_stage=profile_stage, profile_path=profile_path)
         self.sampling_results = {}
 
-    def extract_payment_data_efficiently(self):
-        """Extract only payment_type column from NYC taxi data efficiently"""
-        print(f"🚖 Extracting payment data efficiently (max {self.max_records:,} records)...")
+    @property
+    def payment_data(self):
+        """Per-trip payment DataFrame; a categorical view over payment_codes, built (with pandas) on first use"""
+        if self._payment_data is None and self.payment_codes is not None:
+            import pandas as pd
+            self._payment_data = pd.DataFrame({
+                'payment_type': pd.Categorical.from_codes(self.payment_codes, self.payment_categories)
+            })
+        return self._payment_data
 
-        try:
-            # Download dataset first
-            print("⬇️ Downloading dataset...")
-            dataset_path = kagglehub.dataset_download("dhruvildave/new-york-city-taxi-trips-2019")
-            print(f"📁 Dataset path: {dataset_path}")
+    def _log(self, message, level=1):
+        if self.verbose >= level:
+            print(message)
 
-            # Find SQLite files (data is in SQLite format)
-            import os
-            import sqlite3
-            sqlite_files = []
-            for root, dirs, files in os.walk(dataset_path):
-                for file in files:
-                    if file.endswith('.sqlite'):
-                        sqlite_files.append(os.path.join(root, file))
-
-            if not sqlite_files:
-                print("❌ No SQLite files found")
-                return None
+    def write_metrics(self, path=None):
+        """Write the run's stage metrics as JSON; returns the path, or None if no path is configured"""
+        path = path or self.metrics_path
+        if path is None:
+            return None
+        self.metrics.write(path)
+        self._log(f"⏱️ Run metrics saved as '{path}'")
+        return path
 
-            # Use the first SQLite file
-            sqlite_file = sqlite_files[0]
-            print(f"📄 Processing SQLite file: {sqlite_file}")
+    def extract_payment_data_efficiently(self):
+        """Extract only payment_type column from NYC taxi data efficiently.
 
-            # Connect to SQLite and examine structure
-            conn = sqlite3.connect(sqlite_file)
+        Returns the coded population (payment_codes, indexes into payment_categories)
+        in 'rows' mode, or the payment category counts in 'histogram' mode; None on
+        failure. The pandas view is the payment_data property, built only when read.
+        """
+        if self.population_mode not in ('rows', 'histogram'):
+            raise ValueError(f"Unknown population mode: {self.population_mode!r}")
 
-            # Get table names
-            tables = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table';", conn)
-            print(f"🗂️ Available tables: {list(tables['name'])}")
+        if self.population_mode == 'histogram':
+            self._log(f"🚖 Extracting payment type histogram (all records)...")
+        else:
+            self._log(f"🚖 Extracting payment data efficiently (max {self.max_records:,} records)...")
 
-            # Use the first table (likely the main data table)
-            table_name = tables['name'].iloc[0]
-            print(f"📊 Using table: {table_name}")
+        # A valid cached extract skips the download, connect and SQL steps entirely
+        if self.cache is not None and not self.refresh_cache and self._load_cached_extract():
+            self._calculate_population_stats()
+            return self.payment_codes if self.population_mode == 'rows' else self.payment_counts
 
-            # Get column names
-            sample_df = pd.read_sql(f"SELECT * FROM {table_name} LIMIT 5", conn)
-            print(f"🗂️ Available columns: {list(sample_df.columns)}")
+        try:
+            if self.dataset_path is not None:
+                dataset_path = self.dataset_path
+            else:
+                # Download dataset first
+                self._log("⬇️ Downloading dataset...")
+                with self.metrics.stage('download'):
+                    import kagglehub
+                    dataset_path = kagglehub.dataset_download(DATASET_HANDLE)
+            self._log(f"📁 Dataset path: {dataset_path}")
 
-            # Find payment column
-            payment_col = None
-            for col in sample_df.columns:
-                if 'payment' in col.lower():
-                    payment_col = col
-                    break
+            # Find SQLite files (data is in SQLite format)
+            sqlite_files = self._find_sqlite_files(dataset_path)
 
-            if payment_col is None:
-                print("❌ No payment column found")
-                conn.close()
+            if not sqlite_files:
+                self._log("❌ No SQLite files found", level=0)
                 return None
 
-            print(f"💳 Using payment column: '{payment_col}'")
-
-            # Extract only payment data efficiently from SQLite
-            print(f"📊 Extracting payment data (target: {self.max_records:,} records)...")
-
-            # Get total count
-            total_count = pd.read_sql(f"SELECT COUNT(*) as count FROM {table_name}", conn)['count'].iloc[0]
-            print(f"📈 Total records in database: {total_count:,}")
+            sources = self._discover_sources(sqlite_files)
 
-            # Extract payment data with LIMIT
-            limit = min(self.max_records, total_count)
-            query = f"SELECT {payment_col} FROM {table_name} WHERE {payment_col} IS NOT NULL LIMIT {limit}"
-
-            payment_df = pd.read_sql(query, conn)
-            payment_values = payment_df[payment_col].tolist()
+            if not sources:
+                self._log("❌ No payment column found", level=0)
+                return None
 
-            conn.close()
+            if self.population_mode == 'histogram':
+                # Count categories in-database; memory is O(categories), not O(rows)
+                self._log(f"📊 Counting payment types in-database (GROUP BY)...")
+            else:
+                # Stream each payment column through fetchmany straight into a preallocated code array
+                self._log(f"📊 Extracting payment data (target: {self.max_records:,} records, {self.sampling} sampling)...")
 
-            total_processed = len(payment_values)
-            print(f"   ✅ Extracted {total_processed:,} payment records")
+            extracts = self._extract_sources(sources)
+            self._merge_extracts(extracts)
 
-            # Create efficient DataFrame with just payment data
-            self.payment_data = pd.DataFrame({
-                'payment_type': payment_values
-            })
+            self._log(f"✅ Payment data extracted successfully!")
+            self._log(f"📊 Total records: {int(self.payment_counts.sum()):,}")
+            self._log(f"💳 Payment types found: {dict(zip(self.payment_categories.tolist(), self.payment_counts.tolist()))}")
 
-            print(f"✅ Payment data extracted successfully!")
-            print(f"📊 Total records: {len(self.payment_data):,}")
-            print(f"💳 Payment types found: {self.payment_data['payment_type'].value_counts().to_dict()}")
+            if self.cache is not None:
+                self._store_cached_extract(sources)
 
             # Calculate population statistics
             self._calculate_population_stats()
 
-            return self.payment_data
+            return self.payment_codes if self.population_mode == 'rows' else self.payment_counts
 
         except Exception as e:
-            print(f"❌ Error extracting data: {e}")
+            self._log(f"❌ Error extracting data: {e}", level=0)
             return None
 
+    @staticmethod
+    def _find_sqlite_files(dataset_path):
+        """All .sqlite files under the dataset directory, in a stable order"""
+        sqlite_files = []
+        for root, dirs, files in os.walk(dataset_path):
+            for file in files:
+                if file.endswith('.sqlite'):
+                    sqlite_files.append(os.path.join(root, file))
+        return sorted(sqlite_files)
+
+    @staticmethod
+    def _connect_read_only(sqlite_file):
+        import pathlib
+        import sqlite3
+        return sqlite3.connect(f"{pathlib.Path(sqlite_file).resolve().as_uri()}?mode=ro", uri=True)
+
+    def _discover_sources(self, sqlite_files):
+        """List the (sqlite_file, table, payment_column) sources to scan.
+
+        sources='first' keeps the original behaviour (first file, first table);
+        sources='all' takes every table with a payment column in every file.
+        """
+        if self.sources not in ('first', 'all'):
+            raise ValueError(f"Unknown sources setting: {self.sources!r}")
+
+        files = sqlite_files if self.sources == 'all' else sqlite_files[:1]
+        sources = []
+        for sqlite_file in files:
+            self._log(f"📄 Inspecting SQLite file: {sqlite_file}", level=2)
+            conn = self._connect_read_only(sqlite_file)
+            try:
+                tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+                self._log(f"🗂️ Available tables: {tables}", level=2)
+                if self.sources == 'first':
+                    tables = tables[:1]
+
+                for table_name in tables:
+                    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+                    payment_col = next((col for col in columns if 'payment' in col.lower()), None)
+                    if payment_col is None:
+                        self._log(f"   ⚠️ {table_name}: no payment column, skipped", level=2)
+                        continue
+                    self._log(f"   💳 {table_name}: using payment column '{payment_col}'", level=2)
+                    sources.append((sqlite_file, table_name, payment_col))
+            finally:
+                conn.close()
+        return sources
+
+    @timed_stage('sql_extract')
+    def _extract_sources(self, sources):
+        """Scan every source on a thread pool of read-only connections; results keep source order.
+
+        Head sampling reads sources one after another instead, each up to the rows still
+        needed, so later sources are not read at all once max_records is reached.
+        """
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+
+        sequential = self.population_mode == 'rows' and self.sampling == 'head' and len(sources) > 1
+        n_threads = 1 if sequential else max(1, min(self.extract_workers, len(sources)))
+        self._log(f"🧵 Scanning {len(sources)} source(s) with {n_threads} reader thread(s)...")
+
+        start = time.perf_counter()
+        if sequential:
+            extracts, remaining = [], int(self.max_records)
+            for source_index, source in enumerate(sources):
+                if remaining <= 0:
+                    break
+                extracts.append(self._extract_source(source_index, source, limit=remaining))
+                remaining -= len(extracts[-1]['codes'])
+        else:
+            with ThreadPoolExecutor(max_workers=n_threads) as pool:
+                extracts = list(pool.map(self._extract_source, range(len(sources)), sources))
+        wall_seconds = time.perf_counter() - start
+
+        total_rows = sum(extract['rows'] for extract in extracts)
+        self.metrics.current['rows'] = total_rows
+        self.extraction_report = {
+            'sources': [{key: extract[key] for key in ('path', 'table', 'column', 'rows', 'seconds', 'rows_per_sec')}
+                        for extract in extracts],
+            'rows': total_rows,
+            'wall_seconds': wall_seconds,
+            'rows_per_sec': total_rows / wall_seconds if wall_seconds > 0 else float('nan'),
+        }
+
+        if self.verbose >= 2:
+            self._log(f"📈 Per-source extraction:", level=2)
+            for extract in extracts:
+                self._log(f"   {extract['path']} [{extract['table']}]: {extract['rows']:,} rows in "
+                          f"{extract['seconds']:.2f}s ({extract['rows_per_sec']:,.0f} rows/s)", level=2)
+        self._log(f"📈 Rows scanned: {total_rows:,} in {wall_seconds:.2f}s "
+                  f"({self.extraction_report['rows_per_sec']:,.0f} rows/s)")
+        return extracts
+
+    def _extract_source(self, source_index, source, limit=None):
+        """Extract one (file, table, column) source over its own read-only connection.
+
+        limit caps the rows kept from this source (default max_records).
+        """
+        import time
+
+        sqlite_file, table_name, payment_col = source
+        start = time.perf_counter()
+        conn = self._connect_read_only(sqlite_file)
+        try:
+            if self.population_mode == 'histogram':
+                counts, categories = self._query_payment_counts(conn, table_name, payment_col)
+                codes, rows = None, int(counts.sum())
+            else:
+                # Each source gets its own stream so reservoirs do not depend on thread timing
+                rng = np.random.default_rng(
+                    np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=(EXTRACT_STREAM_KEY, source_index))
+                )
+                codes, categories, rows = self._stream_payment_codes(conn, table_name, payment_col, rng, limit)
+                counts = None
+        finally:
+            conn.close()
+        seconds = time.perf_counter() - start
+
+        return {
+            'path': sqlite_file, 'table': table_name, 'column': payment_col,
+            'rows': rows, 'seconds': seconds, 'rows_per_sec': rows / seconds if seconds > 0 else float('nan'),
+            'codes': codes, 'categories': categories, 'counts': counts,
+        }
+
+    @timed_stage('merge_extracts')
+    def _merge_extracts(self, extracts):
+        """Combine per-source counts or coded arrays into a single population"""
+        category_index = {}
+        lookups = []
+        for extract in extracts:
+            lookups.append(np.array([category_index.setdefault(value, len(category_index))
+                                     for value in extract['categories'].tolist()], dtype=np.int64))
+        categories = np.array(list(category_index))
+
+        if self.population_mode == 'histogram':
+            counts = np.zeros(len(categories), dtype=np.int64)
+            for extract, lookup in zip(extracts, lookups):
+                np.add.at(counts, lookup, extract['counts'])
+            return self._set_payment_counts(counts, categories)
+
+        if len(extracts) == 1:
+            codes = lookups[0][extracts[0]['codes']]
+        elif self.sampling == 'head':
+            # First max_records rows across sources, in source order (each scan got the remaining budget)
+            codes = np.concatenate([lookup[extract['codes']] for extract, lookup in zip(extracts, lookups)])
+        else:
+            # Per-source reservoirs are uniform within each source. Allocating the final sample
+            # across sources hypergeometrically by row count makes it uniform over their union.
+            rng = np.random.default_rng(np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=(EXTRACT_STREAM_KEY,)))
+            rows = np.array([extract['rows'] for extract in extracts], dtype=np.int64)
+            allocation = rng.multivariate_hypergeometric(rows, min(int(self.max_records), int(rows.sum())))
+            codes = np.concatenate([
+                lookup[extract['codes'][rng.choice(len(extract['codes']), size=n_keep, replace=False)]]
+                for extract, lookup, n_keep in zip(extracts, lookups, allocation)
+            ])
+        return self._set_payment_codes(codes, categories)
+
+    def _cache_request(self):
+        """Parameters that determine an extract, apart from the source file itself"""
+        return {
+            'dataset': os.path.abspath(self.dataset_path) if self.dataset_path is not None else DATASET_HANDLE,
+            'population_mode': self.population_mode,
+            'sampling': self.sampling if self.population_mode == 'rows' else None,
+            'max_records': self.max_records if self.population_mode == 'rows' else None,
+            'seed': self.seed if self.population_mode == 'rows' and self.sampling == 'reservoir' else None,
+            'sources': self.sources,
+        }
+
+    @timed_stage('cache_load')
+    def _load_cached_extract(self):
+        """Install a cached extract if one matches the current settings; returns True on a hit"""
+        entry = self.cache.lookup(self._cache_request())
+        if entry is None:
+            self._log(f"🗄️ No valid cached extract in {self.cache.cache_dir}")
+            return False
+
+        codes, categories, counts = self.cache.load(entry)
+        if codes is None:
+            self._set_payment_counts(counts, categories)
+        else:
+            self._set_payment_codes(codes, categories, counts)
+        self._log(f"🗄️ Loaded cached extract {entry['key']} ({len(entry['query']['sources'])} source(s) "
+                  f"from {len(entry['sources'])} file(s))")
+        return True
+
+    @timed_stage('cache_store')
+    def _store_cached_extract(self, sources):
+        """Write the current population to the extract cache"""
+        source_paths = sorted({sqlite_file for sqlite_file, _, _ in sources})
+        entry = self.cache.store(
+            self._cache_request(), source_paths, {'sources': [list(source) for source in sources]},
+            self.payment_codes, self.payment_categories, self.payment_counts
+        )
+        self._log(f"🗄️ Cached extract {entry['key']} in {self.cache.cache_dir}")
+
+    def invalidate_cache(self):
+        """Drop cached extracts for the current settings; returns the number of entries removed"""
+        if self.cache is None:
+            return 0
+        return self.cache.invalidate(self._cache_request())
+
+    def _stream_payment_codes(self, conn, table_name, payment_col, rng=None, limit=None):
+        """Read the payment column in fetchmany chunks into a bounded, preallocated code array.
+
+        With sampling='head' the first max_records non-null rows are kept. With
+        sampling='reservoir' the whole table is scanned once and a uniform random
+        sample of max_records rows is kept (Algorithm R, vectorized per chunk).
+        Peak memory is the code array plus one chunk. limit, if given, replaces
+        max_records as the number of rows kept.
+        """
+        if self.sampling not in ('head', 'reservoir'):
+            raise ValueError(f"Unknown sampling mode: {self.sampling!r}")
+
+        capacity = int(self.max_records if limit is None else limit)
+        query = f"SELECT {payment_col} FROM {table_name} WHERE {payment_col} IS NOT NULL"
+        if self.sampling == 'head':
+            query += f" LIMIT {capacity}"
+
+        codes = np.empty(capacity, dtype=np.uint8)
+        category_index = {}
+        rows_scanned = 0
+
+        cursor = conn.cursor()
+        cursor.arraysize = self.chunk_size
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                break
+
+            chunk = self._code_chunk([row[0] for row in rows], category_index)
+            if len(category_index) > np.iinfo(codes.dtype).max + 1:
+                codes = codes.astype(np.int32)
+
+            # Fill the array until it reaches capacity
+            n_fill = max(0, min(len(chunk), capacity - rows_scanned))
+            codes[rows_scanned:rows_scanned + n_fill] = chunk[:n_fill]
+
+            # Reservoir phase: row g replaces a random slot with probability capacity / (g + 1)
+            if n_fill < len(chunk):
+                positions = rows_scanned + np.arange(n_fill, len(chunk))
+                slots = (rng or self.rng).integers(0, positions + 1)
+                keep = slots < capacity
+                # Later rows must win when a chunk hits the same slot twice
+                kept_slots = slots[keep][::-1]
+                kept_codes = chunk[n_fill:][keep][::-1]
+                kept_slots, first = np.unique(kept_slots, return_index=True)
+                codes[kept_slots] = kept_codes[first]
+
+            rows_scanned += len(chunk)
+        cursor.close()
+
+        n_kept = min(rows_scanned, capacity)
+        if n_kept < capacity:
+            codes = codes[:n_kept].copy()
+
+        categories = np.array(list(category_index))
+        return codes, categories, rows_scanned
+
+    @staticmethod
+    def _query_payment_counts(conn, table_name, payment_col):
+        """Count rows per payment type with a single GROUP BY scan"""
+        rows = conn.execute(
+            f"SELECT {payment_col}, COUNT(*) FROM {table_name} "
+            f"WHERE {payment_col} IS NOT NULL GROUP BY {payment_col}"
+        ).fetchall()
+        categories = np.array([row[0] for row in rows])
+        counts = np.array([row[1] for row in rows], dtype=np.int64)
+        return counts, categories
+
+    @staticmethod
+    def _code_chunk(values, category_index):
+        """Map one chunk of raw payment values to integer codes, extending category_index in place"""
+        chunk_categories, inverse = np.unique(np.asarray(values), return_inverse=True)
+        lookup = np.array([category_index.setdefault(value, len(category_index))
+                           for value in chunk_categories.tolist()], dtype=np.int64)
+        return lookup[inverse.ravel()]
+
+    def _encode_payment_values(self, payment_values):
+        """Store payment types as a compact integer-coded array plus category lookup"""
+        categories, codes = np.unique(np.asarray(payment_values), return_inverse=True)
+        return self._set_payment_codes(codes.ravel(), categories)
+
+    def _set_payment_codes(self, codes, categories, counts=None):
+        """Install a coded population, with categories sorted and codes narrowed to the smallest dtype.
+
+        counts, if given, must already be aligned with the sorted categories; it saves a pass over codes.
+        """
+        categories = np.asarray(categories)
+        try:
+            order = np.argsort(categories, kind='stable')
+        except TypeError:
+            order = np.arange(len(categories))
+        remap = np.empty(len(order), dtype=np.int64)
+        remap[order] = np.arange(len(order))
+
+        self.payment_categories = categories[order]
+        code_dtype = np.min_scalar_type(max(len(categories) - 1, 0))
+        if np.array_equal(order, np.arange(len(order))):
+            # Already canonical (e.g. a memory-mapped cached extract): keep it without copying
+            self.payment_codes = codes.astype(code_dtype, copy=False)
+        else:
+            self.payment_codes = remap[codes].astype(code_dtype)
+        if counts is None:
+            counts = np.bincount(self.payment_codes, minlength=len(self.payment_categories))
+        self.payment_counts = np.asarray(counts, dtype=np.int64)
+        self._payment_data = None
+        return self.payment_codes
+
+    def _set_payment_counts(self, counts, categories):
+        """Install a histogram population: category counts only, no per-row data"""
+        categories = np.asarray(categories)
+        try:
+            order = np.argsort(categories, kind='stable')
+        except TypeError:
+            order = np.arange(len(categories))
+
+        self.payment_categories = categories[order]
+        self.payment_counts = np.asarray(counts, dtype=np.int64)[order]
+        self.payment_codes = None
+        self._payment_data = None
+        return self.payment_counts
+
+    def _category_code(self, payment_type):
+        """Return the integer code of a payment type, or None if it is absent"""
+        matches = np.flatnonzero(self.payment_categories == payment_type)
+        return int(matches[0]) if len(matches) else None
+
+    @timed_stage('population_stats')
     def _calculate_population_stats(self):
         """Calculate true population statistics from payment data"""
-        print(f"\n📈 Calculating population statistics...")
+        self._log(f"\n📈 Calculating population statistics...")
 
-        payment_counts = self.payment_data['payment_type'].value_counts()
-        total_records = len(self.payment_data)
-        payment_percentages = (payment_counts / total_records * 100).to_dict()
+        counts = self.payment_counts
+        total_records = int(counts.sum())
+        self.metrics.current['rows'] = total_records
+        order = np.argsort(-counts, kind='stable')
+        payment_counts = {self.payment_categories[i].item(): int(counts[i]) for i in order if counts[i] > 0}
+        payment_percentages = {ptype: count / total_records * 100 for ptype, count in payment_counts.items()}
 
         self.population_stats = {
             'total_records': total_records,
-            'payment_counts': payment_counts.to_dict(),
+            'payment_counts': payment_counts,
             'payment_percentages': payment_percentages
         }
 
-        print(f"🏙️ POPULATION STATISTICS (TRUE PARAMETERS):")
-        print(f"Total records: {total_records:,}")
+        self._log(f"🏙️ POPULATION STATISTICS (TRUE PARAMETERS):")
+        self._log(f"Total records: {total_records:,}")
         for payment_type, pct in payment_percentages.items():
             count = payment_counts[payment_type]
-            print(f"  Payment type {payment_type}: {pct:.2f}% ({count:,} records)")
+            self._log(f"  Payment type {payment_type}: {pct:.2f}% ({count:,} records)", level=2)
 
         return self.population_stats
 
     def run_sampling_simulation(self):
         """Run sampling simulation using real payment data"""
-        if self.payment_data is None:
-            print("❌ No payment data. Run extract_payment_data_efficiently() first.")
+        if self.payment_counts is None:
+            self._log("❌ No payment data. Run extract_payment_data_efficiently() first.", level=0)
             return None
 
-        print(f"\n🎯 Running sampling simulation on REAL NYC taxi data...")
-        print(f"📊 Sample sizes: {self.sample_sizes}")
-        print(f"🔄 Simulations per size: {self.n_simulations}")
+        if self.method not in ('monte_carlo', 'exact'):
+            raise ValueError(f"Unknown method: {self.method!r}")
+
+        self._log(f"\n🎯 Running sampling simulation on REAL NYC taxi data...")
+        self._log(f"📊 Sample sizes: {self.sample_sizes}")
+        if self.method == 'exact':
+            self._log(f"🧮 Exact hypergeometric sampling distributions (no simulation)")
+        elif self.tolerance is None:
+            self._log(f"🔄 Simulations per size: {self.n_simulations}")
+        else:
+            self._log(f"🔄 Adaptive simulations: start at {self.n_simulations}, tolerance ±{self.tolerance}%, "
+                      f"budget {self.max_simulations_per_size:,} per size")
 
         # Get the main payment types (typically 1=Credit, 2=Cash)
         payment_types = list(self.population_stats['payment_percentages'].keys())
-        print(f"💳 Payment types in data: {payment_types}")
+        self._log(f"💳 Payment types in data: {payment_types}")
 
         # Identify cash vs card (common mapping: 1=Credit, 2=Cash)
         cash_type = None
@@ -173,85 +1102,343 @@ class EfficientTaxiSamplingExperiment:
                 card_type = sorted_types[0]  # Most common assumed to be card
                 cash_type = sorted_types[1]  # Second most common assumed to be cash
 
-        print(f"💳 Using Card type: {card_type}, Cash type: {cash_type}")
+        self._log(f"💳 Using Card type: {card_type}, Cash type: {cash_type}")
 
         # Get true population percentages
         true_cash_pct = self.population_stats['payment_percentages'].get(cash_type, 0)
         true_card_pct = self.population_stats['payment_percentages'].get(card_type, 0)
 
-        results = {}
+        cash_code = self._category_code(cash_type)
+        card_code = self._category_code(card_type)
 
+        population_size = self.population_stats['total_records']
+        sample_sizes = []
         for sample_size in self.sample_sizes:
-            if sample_size > len(self.payment_data):
-                print(f"⚠️ Sample size {sample_size} larger than available data ({len(self.payment_data)}), skipping...")
+            if sample_size > population_size:
+                self._log(f"⚠️ Sample size {sample_size} larger than available data ({population_size}), skipping...", level=0)
                 continue
+            sample_sizes.append(sample_size)
+
+        if self.method == 'exact':
+            results = self._exact_results(sample_sizes, cash_code, card_code, true_cash_pct, true_card_pct)
+            if self.cross_check:
+                self._log(f"\n🔁 Cross-checking exact results with Monte Carlo ({self.n_simulations} simulations per size)...")
+                simulated = self._monte_carlo_results(sample_sizes, cash_code, card_code,
+                                                      true_cash_pct, true_card_pct, verbose=False)
+                for sample_size, result in results.items():
+                    result['monte_carlo'] = {key: simulated[sample_size][key] for key in SUMMARY_KEYS}
+                    self._log(f"   n={sample_size:,}: exact SE {result['cash_std']:.3f}% vs MC {simulated[sample_size]['cash_std']:.3f}%, "
+                              f"exact CI ({result['cash_ci_lower']:.2f}, {result['cash_ci_upper']:.2f}) vs MC "
+                              f"({simulated[sample_size]['cash_ci_lower']:.2f}, {simulated[sample_size]['cash_ci_upper']:.2f})", level=2)
+        else:
+            results = self._monte_carlo_results(sample_sizes, cash_code, card_code, true_cash_pct, true_card_pct)
 
-            print(f"\n🔬 Testing sample size: {sample_size:,}")
+        self.sampling_results = results
+        self.cash_type = cash_type
+        self.card_type = card_type
+        return results
 
-            sample_results = []
-            for sim in range(self.n_simulations):
-                # Draw random sample from real data
-                sample = self.payment_data.sample(n=sample_size, replace=False)
+    @timed_stage('exact')
+    def _exact_results(self, sample_sizes, cash_code, card_code, true_cash_pct, true_card_pct):
+        """Exact sampling distributions of the cash and card shares, with no simulation.
 
-                # Calculate payment percentages for this sample
-                sample_counts = sample['payment_type'].value_counts()
-                total_sample = len(sample)
+        Counts in a sample drawn without replacement are hypergeometric, so each share's
+        mean, finite-population-corrected SE, quantile CI, MAE and RMSE come straight
+        from its pmf in O(sample_size) per size.
+        """
+        population_size = self.population_stats['total_records']
+        results = {}
+        for sample_size in sample_sizes:
+            result = {'sample_results': [], 'method': 'exact', 'n_simulations': 0}
+            for prefix, code, true_pct in (('cash', cash_code, true_cash_pct), ('card', card_code, true_card_pct)):
+                successes = int(self.payment_counts[code]) if code is not None else 0
+                support, pmf = hypergeometric_pmf(population_size, successes, sample_size)
+                percentages = support / sample_size * 100
+                cdf = np.cumsum(pmf)
+                share = successes / population_size
+                variance = sample_size * share * (1 - share) * (population_size - sample_size) / max(population_size - 1, 1)
+
+                result[f'{prefix}_mean'] = share * 100
+                result[f'{prefix}_std'] = float(np.sqrt(variance)) / sample_size * 100
+                result[f'{prefix}_ci_lower'] = float(percentages[min(np.searchsorted(cdf, 0.025), len(cdf) - 1)])
+                result[f'{prefix}_ci_upper'] = float(percentages[min(np.searchsorted(cdf, 0.975), len(cdf) - 1)])
+                if prefix == 'cash':
+                    result['mean_absolute_error'] = float((pmf * np.abs(percentages - true_pct)).sum())
+                    result['rmse'] = result['cash_std']  # the estimator is unbiased
+                    result['cash_pmf'] = np.zeros(sample_size + 1)
+                    result['cash_pmf'][support] = pmf
+
+            results[sample_size] = result
+            self._print_size_summary(sample_size, result, true_cash_pct, true_card_pct)
+        return results
 
-                cash_count = sample_counts.get(cash_type, 0)
-                card_count = sample_counts.get(card_type, 0)
+    def _print_size_summary(self, sample_size, result, true_cash_pct, true_card_pct):
+        """Print one sample size's estimates against the population truth"""
+        if self.verbose < 2:
+            return
 
-                cash_pct = (cash_count / total_sample) * 100
-                card_pct = (card_count / total_sample) * 100
+        self._log(f"\n🔬 Testing sample size: {sample_size:,}")
 
-                sample_results.append({
-                    'simulation': sim + 1,
-                    'sample_size': sample_size,
-                    'cash_percentage': cash_pct,
-                    'card_percentage': card_pct,
-                    'cash_error': cash_pct - true_cash_pct,
-                    'card_error': card_pct - true_card_pct
-                })
+        # Calculate theoretical vs empirical standard error
+        theoretical_se = np.sqrt(true_cash_pct * (100 - true_cash_pct) / sample_size)
+        empirical_se = result['cash_std']
+        se_label = "Exact SE (FPC)" if result.get('method') == 'exact' else "Empirical SE"
 
-            # Calculate statistics for this sample size
-            cash_percentages = [r['cash_percentage'] for r in sample_results]
-            card_percentages = [r['card_percentage'] for r in sample_results]
-            cash_errors = [r['cash_error'] for r in sample_results]
-
-            results[sample_size] = {
-                'sample_results': sample_results,
-                'cash_mean': np.mean(cash_percentages),
-                'cash_std': np.std(cash_percentages),
-                'cash_ci_lower': np.percentile(cash_percentages, 2.5),
-                'cash_ci_upper': np.percentile(cash_percentages, 97.5),
-                'card_mean': np.mean(card_percentages),
-                'card_std': np.std(card_percentages),
-                'card_ci_lower': np.percentile(card_percentages, 2.5),
-                'card_ci_upper': np.percentile(card_percentages, 97.5),
-                'mean_absolute_error': np.mean(np.abs(cash_errors)),
-                'rmse': np.sqrt(np.mean(np.array(cash_errors)**2))
-            }
+        self._log(f"   💳 Cash: {result['cash_mean']:.2f}% ± {empirical_se:.2f}% (True: {true_cash_pct:.2f}%)")
+        self._log(f"   💳 Card: {result['card_mean']:.2f}% ± {result['card_std']:.2f}% (True: {true_card_pct:.2f}%)")
+        self._log(f"   📊 Theoretical SE: {theoretical_se:.2f}%, {se_label}: {empirical_se:.2f}%")
+        self._log(f"   🎯 Mean Absolute Error: {result['mean_absolute_error']:.2f}%")
 
-            # Calculate theoretical vs empirical standard error
-            theoretical_se = np.sqrt(true_cash_pct * (100 - true_cash_pct) / sample_size)
-            empirical_se = results[sample_size]['cash_std']
+    @timed_stage('simulate')
+    def _monte_carlo_results(self, sample_sizes, cash_code, card_code, true_cash_pct, true_card_pct, verbose=True):
+        """Simulate every sample size and summarize it; see _simulation_tasks for the block layout"""
+        results = {}
+        stats_class = StreamingSimulationStats if self.streaming_stats else SimulationStats
+        stats = {size: stats_class(size, true_cash_pct, true_card_pct) for size in sample_sizes}
+        blocks_done = dict.fromkeys(sample_sizes, 0)
+        sweep_seconds = dict.fromkeys(sample_sizes, 0.0)
+
+        # In streaming mode the per-simulation CSV is written block by block instead of at report time
+        detail_file = None
+        if self.streaming_stats and self.detailed_csv_path:
+            import csv
+            detail_file = open(self.detailed_csv_path, 'w', newline='')
+            detail_writer = csv.writer(detail_file)
+            detail_writer.writerow(DETAILED_CSV_COLUMNS)
 
-            print(f"   💳 Cash: {results[sample_size]['cash_mean']:.2f}% ± {empirical_se:.2f}% (True: {true_cash_pct:.2f}%)")
-            print(f"   💳 Card: {results[sample_size]['card_mean']:.2f}% ± {results[sample_size]['card_std']:.2f}% (True: {true_card_pct:.2f}%)")
-            print(f"   📊 Theoretical SE: {theoretical_se:.2f}%, Empirical SE: {empirical_se:.2f}%")
-            print(f"   🎯 Mean Absolute Error: {results[sample_size]['mean_absolute_error']:.2f}%")
+        try:
+            with self._task_runner() as run_tasks:
+                # Fixed mode is a single round; adaptive mode doubles unconverged sizes each round
+                round_sizes = {size: self.n_simulations for size in sample_sizes}
+                rounds = 0
+                while round_sizes:
+                    rounds += 1
+                    tasks = self._simulation_tasks(round_sizes, blocks_done, (cash_code, card_code))
+                    block_start = time.perf_counter()
+                    for task, (cash_counts, card_counts) in zip(tasks, run_tasks(tasks)):
+                        sample_size = task[0]
+                        simulations_done = stats[sample_size].count
+                        stats[sample_size].update(cash_counts, card_counts)
+
+                        if detail_file is not None:
+                            cash_percentages = cash_counts / sample_size * 100
+                            card_percentages = card_counts / sample_size * 100
+                            detail_writer.writerows(zip(
+                                [sample_size] * len(cash_counts),
+                                range(simulations_done + 1, simulations_done + len(cash_counts) + 1),
+                                cash_percentages.tolist(), card_percentages.tolist(),
+                                (cash_percentages - true_cash_pct).tolist(), (card_percentages - true_card_pct).tolist()
+                            ))
+
+                        # Time between block arrivals is charged to that block's sample size
+                        block_end = time.perf_counter()
+                        sweep_seconds[sample_size] += block_end - block_start
+                        block_start = block_end
+
+                    next_round = {}
+                    for sample_size in round_sizes:
+                        simulations_done = stats[sample_size].count
+                        diagnostics = {'n_simulations': simulations_done, 'rounds': rounds}
+                        if self.tolerance is not None:
+                            errors = stats[sample_size].monte_carlo_errors()
+                            converged = max(errors.values()) <= self.tolerance
+                            budget_left = self.max_simulations_per_size - simulations_done
+                            if not converged and budget_left > 0:
+                                next_round[sample_size] = min(simulations_done, budget_left)
+                                continue
+                            diagnostics.update(errors, converged=converged)
+
+                        results[sample_size] = {**stats.pop(sample_size).summary(), **diagnostics}
+                        if verbose:
+                            self._print_size_summary(sample_size, results[sample_size], true_cash_pct, true_card_pct)
+                        if verbose and self.tolerance is not None and self.verbose >= 2:
+                            status = "converged" if diagnostics['converged'] else "budget exhausted"
+                            self._log(f"   🔁 {simulations_done:,} simulations over {rounds} rounds ({status}); "
+                                      f"MC error SE ±{diagnostics['se_mc_error']:.3f}%, "
+                                      f"CI ±{diagnostics['ci_lower_mc_error']:.3f}/{diagnostics['ci_upper_mc_error']:.3f}%", level=2)
+                    round_sizes = next_round
+        finally:
+            if detail_file is not None:
+                detail_file.close()
+
+        self.metrics.current['simulations'] = sum(results[size]['n_simulations'] for size in sample_sizes)
+        self.metrics.current['sample_sizes'] = {
+            str(size): {
+                'simulations': results[size]['n_simulations'],
+                'seconds': sweep_seconds[size],
+                'simulations_per_sec': results[size]['n_simulations'] / sweep_seconds[size] if sweep_seconds[size] > 0 else None,
+            }
+            for size in sample_sizes
+        }
+        return {size: results[size] for size in sample_sizes}
+
+    def _simulation_tasks(self, round_sizes, blocks_done, codes_of_interest):
+        """Split a round into (sample_size, block) tasks; the split never depends on the worker count.
+
+        Block indices continue across rounds (blocks_done is advanced in place), so each
+        block keeps its own stream, SeedSequence(entropy, spawn_key=(sample_size, block_index)).
+        """
+        entropy = self.seed_sequence.entropy
+        tasks = []
+        for sample_size, n_simulations in round_sizes.items():
+            block_size = max(1, min(self.batch_size, MAX_BLOCK_ELEMENTS // sample_size))
+            for start in range(0, n_simulations, block_size):
+                n_draws = min(block_size, n_simulations - start)
+                tasks.append((sample_size, blocks_done[sample_size], n_draws, entropy, codes_of_interest))
+                blocks_done[sample_size] += 1
+        return tasks
+
+    @contextmanager
+    def _task_runner(self):
+        """Yield a function mapping simulation tasks to block results, in task order.
+
+        With workers > 1 the tasks run on one process pool for the whole sweep, and the
+        coded population is shared with workers as a memory-mapped .npy rather than
+        pickled per task. Results are identical for any worker count.
+        """
+        if self.workers <= 1:
+            yield lambda tasks: (_simulate_block(task, self.payment_codes, self.payment_counts) for task in tasks)
+            return
+
+        import tempfile
+        from concurrent.futures import ProcessPoolExecutor
+
+        with tempfile.TemporaryDirectory(prefix='taxi_population_') as tmpdir:
+            codes_path = None
+            if self.payment_codes is not None:
+                codes_path = getattr(self.payment_codes, 'filename', None)
+                if codes_path is None:
+                    codes_path = os.path.join(tmpdir, 'payment_codes.npy')
+                    np.save(codes_path, self.payment_codes)
+
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(codes_path, self.payment_counts)) as pool:
+                yield lambda tasks: pool.map(_simulate_block_in_worker, tasks,
+                                             chunksize=max(1, len(tasks) // (self.workers * 8)))
+
+    def save_population(self, workdir):
+        """Write the extracted population as a stage artifact: population.json plus payment_codes.npy in rows mode"""
+        import json
+        os.makedirs(workdir, exist_ok=True)
+        if self.payment_codes is not None:
+            np.save(os.path.join(workdir, 'payment_codes.npy'), np.ascontiguousarray(self.payment_codes))
+        with open(os.path.join(workdir, 'population.json'), 'w') as f:
+            json.dump({
+                'population_mode': self.population_mode,
+                'categories': self.payment_categories.tolist(),
+                'counts': self.payment_counts.tolist(),
+                'has_codes': self.payment_codes is not None,
+                'extraction_report': self.extraction_report,
+            }, f, indent=2, default=float)
+        self._log(f"💾 Population artifact saved in '{workdir}'")
+
+    def load_population(self, workdir, load_codes=True):
+        """Install the population artifact written by save_population; codes are memory-mapped"""
+        import json
+        with open(os.path.join(workdir, 'population.json')) as f:
+            population = json.load(f)
+        categories = np.array(population['categories'])
+        counts = np.array(population['counts'], dtype=np.int64)
+        self.population_mode = population['population_mode']
+        self.extraction_report = population['extraction_report']
+        if population['has_codes'] and load_codes:
+            codes = np.load(os.path.join(workdir, 'payment_codes.npy'), mmap_mode='r')
+            self._set_payment_codes(codes, categories, counts)
+        else:
+            self._set_payment_counts(counts, categories)
+        self._calculate_population_stats()
+        return self.population_stats
 
+    def save_results(self, workdir):
+        """Write sampling results as a stage artifact: scalars to results.json, arrays to results.npz"""
+        import json
+        os.makedirs(workdir, exist_ok=True)
+        arrays = {}
+        sizes = {}
+        for size, result in self.sampling_results.items():
+            scalars = {}
+            for key, value in result.items():
+                if key == 'sample_results':
+                    if value:
+                        arrays[f'{size}/cash_percentage'] = np.array([r['cash_percentage'] for r in value])
+                        arrays[f'{size}/card_percentage'] = np.array([r['card_percentage'] for r in value])
+                elif isinstance(value, np.ndarray):
+                    arrays[f'{size}/{key}'] = value
+                else:
+                    scalars[key] = value
+            sizes[str(size)] = scalars
+
+        np.savez(os.path.join(workdir, 'results.npz'), **arrays)
+        with open(os.path.join(workdir, 'results.json'), 'w') as f:
+            json.dump({
+                'cash_type': self.cash_type,
+                'card_type': self.card_type,
+                'settings': {
+                    'n_simulations': self.n_simulations,
+                    'method': self.method,
+                    'tolerance': self.tolerance,
+                    'max_simulations_per_size': self.max_simulations_per_size,
+                    'streaming_stats': self.streaming_stats,
+                    'detailed_csv_path': self.detailed_csv_path,
+                    'seed_entropy': str(self.seed_sequence.entropy),
+                },
+                'sizes': sizes,
+            }, f, indent=2, default=float)
+        self._log(f"💾 Results artifact saved in '{workdir}'")
+
+    def load_results(self, workdir):
+        """Install the results artifact written by save_results (load the population first)"""
+        import json
+        with open(os.path.join(workdir, 'results.json')) as f:
+            saved = json.load(f)
+        for key, value in saved['settings'].items():
+            if key != 'seed_entropy':
+                setattr(self, key, value)
+        self.cash_type = saved['cash_type']
+        self.card_type = saved['card_type']
+        true_cash_pct = self.population_stats['payment_percentages'].get(self.cash_type, 0)
+        true_card_pct = self.population_stats['payment_percentages'].get(self.card_type, 0)
+
+        with np.load(os.path.join(workdir, 'results.npz')) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+
+        results = {}
+        for size_key, scalars in saved['sizes'].items():
+            size = int(size_key)
+            result = {**scalars, 'sample_results': []}
+            for name, value in arrays.items():
+                prefix, key = name.split('/', 1)
+                if prefix == size_key and key not in ('cash_percentage', 'card_percentage'):
+                    result[key] = value
+            if f'{size_key}/cash_percentage' in arrays:
+                cash = arrays[f'{size_key}/cash_percentage'].tolist()
+                card = arrays[f'{size_key}/card_percentage'].tolist()
+                result['sample_results'] = [
+                    {
+                        'simulation': sim + 1,
+                        'sample_size': size,
+                        'cash_percentage': cash_pct,
+                        'card_percentage': card_pct,
+                        'cash_error': cash_pct - true_cash_pct,
+                        'card_error': card_pct - true_card_pct
+                    }
+                    for sim, (cash_pct, card_pct) in enumerate(zip(cash, card))
+                ]
+            results[size] = result
         self.sampling_results = results
-        self.cash_type = cash_type
-        self.card_type = card_type
         return results
 
+    @timed_stage('visualization')
     def create_visualizations(self):
         """Create comprehensive visualizations of sampling results"""
         if not self.sampling_results:
-            print("❌ No sampling results. Run run_sampling_simulation() first.")
+            self._log("❌ No sampling results. Run run_sampling_simulation() first.", level=0)
             return None
 
-        print(f"\n📊 Creating visualizations...")
+        self._log(f"\n📊 Creating visualizations...")
+
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
 
         # Create comprehensive figure
         fig = make_subplots(
@@ -315,16 +1502,29 @@ class EfficientTaxiSamplingExperiment:
         # Plot 5: Distribution of estimates
         if sample_sizes:
             largest_size = max(sample_sizes)
-            cash_estimates = [r['cash_percentage'] for r in self.sampling_results[largest_size]['sample_results']]
-            fig.add_trace(go.Histogram(x=cash_estimates, nbinsx=25, name=f'Distribution (n={largest_size:,})',
-                                      opacity=0.7, marker_color='purple'), row=3, col=1)
+            largest_result = self.sampling_results[largest_size]
+            if largest_result['sample_results']:
+                cash_estimates = [r['cash_percentage'] for r in largest_result['sample_results']]
+                fig.add_trace(go.Histogram(x=cash_estimates, nbinsx=25, name=f'Distribution (n={largest_size:,})',
+                                          opacity=0.7, marker_color='purple'), row=3, col=1)
+            else:
+                # Streaming runs keep only the frequency of each possible count; exact runs keep the pmf
+                frequencies = largest_result.get('cash_count_histogram', largest_result.get('cash_pmf'))
+                observed = np.flatnonzero(frequencies)
+                cash_estimates = observed / largest_size * 100
+                fig.add_trace(go.Bar(x=cash_estimates, y=frequencies[observed], name=f'Distribution (n={largest_size:,})',
+                                    opacity=0.7, marker_color='purple'), row=3, col=1)
             fig.add_vline(x=true_cash_pct, line_dash="dash", line_color="red", row=3, col=1)
 
         # Plot 6: Sampling errors
         if sample_sizes:
-            sampling_errors = [r['cash_error'] for r in self.sampling_results[largest_size]['sample_results']]
-            fig.add_trace(go.Histogram(x=sampling_errors, nbinsx=25, name='Sampling Errors',
-                                      opacity=0.7, marker_color='orange'), row=3, col=2)
+            if largest_result['sample_results']:
+                sampling_errors = [r['cash_error'] for r in largest_result['sample_results']]
+                fig.add_trace(go.Histogram(x=sampling_errors, nbinsx=25, name='Sampling Errors',
+                                          opacity=0.7, marker_color='orange'), row=3, col=2)
+            else:
+                fig.add_trace(go.Bar(x=cash_estimates - true_cash_pct, y=frequencies[observed], name='Sampling Errors',
+                                    opacity=0.7, marker_color='orange'), row=3, col=2)
             fig.add_vline(x=0, line_dash="dash", line_color="black", row=3, col=2)
 
         # Update layout
@@ -339,36 +1539,43 @@ class EfficientTaxiSamplingExperiment:
 
         # Save plots
         fig.write_html("real_data_sampling_analysis.html")
-        print(f"✅ Interactive visualization saved as 'real_data_sampling_analysis.html'")
+        self._log(f"✅ Interactive visualization saved as 'real_data_sampling_analysis.html'")
 
         return fig
 
+    @timed_stage('report')
     def generate_final_report(self):
         """Generate comprehensive final report"""
         if not self.population_stats or not self.sampling_results:
-            print("❌ Missing data for report generation.")
+            self._log("❌ Missing data for report generation.", level=0)
             return None
 
-        print(f"\n📊 REAL NYC TAXI DATA SAMPLING EXPERIMENT REPORT")
-        print(f"=" * 65)
+        self._log(f"\n📊 REAL NYC TAXI DATA SAMPLING EXPERIMENT REPORT")
+        self._log(f"=" * 65)
 
         # Population statistics
         true_cash_pct = self.population_stats['payment_percentages'][self.cash_type]
         true_card_pct = self.population_stats['payment_percentages'][self.card_type]
 
-        print(f"\n🏙️ REAL POPULATION PARAMETERS:")
-        print(f"Data source: NYC Taxi 2019 (Kaggle)")
-        print(f"Records analyzed: {self.population_stats['total_records']:,}")
-        print(f"Cash payments (type {self.cash_type}): {true_cash_pct:.2f}%")
-        print(f"Card payments (type {self.card_type}): {true_card_pct:.2f}%")
-
-        print(f"\n📊 SAMPLING SIMULATION RESULTS:")
-        print(f"Sample sizes: {list(self.sampling_results.keys())}")
-        print(f"Simulations per size: {self.n_simulations}")
+        self._log(f"\n🏙️ REAL POPULATION PARAMETERS:")
+        self._log(f"Data source: NYC Taxi 2019 (Kaggle)")
+        self._log(f"Records analyzed: {self.population_stats['total_records']:,}")
+        self._log(f"Cash payments (type {self.cash_type}): {true_cash_pct:.2f}%")
+        self._log(f"Card payments (type {self.card_type}): {true_card_pct:.2f}%")
+
+        self._log(f"\n📊 SAMPLING SIMULATION RESULTS:")
+        self._log(f"Sample sizes: {list(self.sampling_results.keys())}")
+        if self.method == 'exact':
+            self._log(f"Simulations per size: none (exact hypergeometric distributions)")
+        elif self.tolerance is None:
+            self._log(f"Simulations per size: {self.n_simulations}")
+        else:
+            self._log(f"Simulations per size: adaptive (tolerance ±{self.tolerance}%, "
+                      f"budget {self.max_simulations_per_size:,})")
 
-        print(f"\n📈 CONVERGENCE TO POPULATION TRUTH:")
-        print(f"{'Size':<10} {'Mean%':<8} {'Error%':<8} {'SE%':<8} {'95% CI':<18} {'Margin±%':<10}")
-        print(f"{'-'*70}")
+        self._log(f"\n📈 CONVERGENCE TO POPULATION TRUTH:")
+        self._log(f"{'Size':<10} {'Mean%':<8} {'Error%':<8} {'SE%':<8} {'95% CI':<18} {'Margin±%':<10}")
+        self._log(f"{'-'*70}")
 
         for size in sorted(self.sampling_results.keys()):
             result = self.sampling_results[size]
@@ -376,14 +1583,25 @@ class EfficientTaxiSamplingExperiment:
             margin = 1.96 * result['cash_std']
             ci = f"({result['cash_ci_lower']:.1f},{result['cash_ci_upper']:.1f})"
 
-            print(f"{size:<10,} {result['cash_mean']:<8.2f} {error:<8.2f} {result['cash_std']:<8.2f} {ci:<18} {margin:<10.2f}")
+            self._log(f"{size:<10,} {result['cash_mean']:<8.2f} {error:<8.2f} {result['cash_std']:<8.2f} {ci:<18} {margin:<10.2f}")
 
-        print(f"\n✅ KEY EMPIRICAL FINDINGS:")
-        print(f"• Sample means converge to true population parameter ({true_cash_pct:.1f}%)")
-        print(f"• Standard error decreases as 1/√n as theory predicts")
-        print(f"• Confidence intervals contain true value ~95% of time")
-        print(f"• Larger samples provide dramatically better precision")
-        print(f"• Real data confirms sampling theory predictions")
+        if self.method == 'monte_carlo' and self.tolerance is not None:
+            self._log(f"\n🔁 ADAPTIVE SIMULATION DIAGNOSTICS:")
+            self._log(f"{'Size':<10} {'Sims':<10} {'Rounds':<8} {'SE MCerr':<10} {'CI MCerr':<16} {'Status':<10}")
+            self._log(f"{'-'*70}")
+            for size in sorted(self.sampling_results.keys()):
+                result = self.sampling_results[size]
+                ci_error = f"({result['ci_lower_mc_error']:.3f},{result['ci_upper_mc_error']:.3f})"
+                status = "converged" if result['converged'] else "budget"
+                self._log(f"{size:<10,} {result['n_simulations']:<10,} {result['rounds']:<8} "
+                          f"{result['se_mc_error']:<10.3f} {ci_error:<16} {status:<10}")
+
+        self._log(f"\n✅ KEY EMPIRICAL FINDINGS:")
+        self._log(f"• Sample means converge to true population parameter ({true_cash_pct:.1f}%)")
+        self._log(f"• Standard error decreases as 1/√n as theory predicts")
+        self._log(f"• Confidence intervals contain true value ~95% of time")
+        self._log(f"• Larger samples provide dramatically better precision")
+        self._log(f"• Real data confirms sampling theory predictions")
 
         # Save detailed CSV results
         self._save_csv_results()
@@ -394,7 +1612,12 @@ class EfficientTaxiSamplingExperiment:
             f.write("=" * 50 + "\n\n")
             f.write(f"Population size: {self.population_stats['total_records']:,}\n")
             f.write(f"True cash percentage: {true_cash_pct:.3f}%\n")
-            f.write(f"Sample sizes tested: {list(self.sampling_results.keys())}\n\n")
+            f.write(f"Sample sizes tested: {list(self.sampling_results.keys())}\n")
+            if self.method == 'exact':
+                f.write("Method: exact hypergeometric sampling distributions\n")
+            elif self.tolerance is not None:
+                f.write(f"Adaptive simulation tolerance: ±{self.tolerance}%\n")
+            f.write("\n")
 
             for size in sorted(self.sampling_results.keys()):
                 result = self.sampling_results[size]
@@ -403,10 +1626,17 @@ class EfficientTaxiSamplingExperiment:
                 f.write(f"  Standard Error: {result['cash_std']:.3f}%\n")
                 f.write(f"  95% CI: ({result['cash_ci_lower']:.2f}, {result['cash_ci_upper']:.2f})\n")
                 f.write(f"  Bias: {result['cash_mean'] - true_cash_pct:.3f}%\n")
-                f.write(f"  RMSE: {result['rmse']:.3f}%\n\n")
+                f.write(f"  RMSE: {result['rmse']:.3f}%\n")
+                if self.method == 'monte_carlo' and self.tolerance is not None:
+                    f.write(f"  Simulations: {result['n_simulations']:,} ({result['rounds']} rounds, "
+                            f"{'converged' if result['converged'] else 'budget exhausted'})\n")
+                    f.write(f"  Monte Carlo error: SE ±{result['se_mc_error']:.4f}%, "
+                            f"CI ±({result['ci_lower_mc_error']:.4f}, {result['ci_upper_mc_error']:.4f})%\n")
+                f.write("\n")
 
-        print(f"\n💾 Report saved as 'real_data_sampling_report.txt'")
+        self._log(f"\n💾 Report saved as 'real_data_sampling_report.txt'")
 
+    @timed_stage('csv')
     def _save_csv_results(self):
         """Save detailed sampling results to CSV files"""
         import pandas as pd
@@ -433,7 +1663,14 @@ class EfficientTaxiSamplingExperiment:
         summary_df = pd.DataFrame(summary_data)
         summary_df.to_csv('hundred_samples_summary.csv', index=False)
 
-        # Save detailed individual results
+        # Save detailed individual results (streaming runs already wrote them during simulation)
+        if not self.detailed_csv_path or self.method == 'exact':
+            self._log(f"💾 CSV file saved: 'hundred_samples_summary.csv'")
+            return
+        if self.streaming_stats:
+            self._log(f"💾 CSV files saved: 'hundred_samples_summary.csv' and '{self.detailed_csv_path}'")
+            return
+
         detailed_data = []
         for size in sorted(self.sampling_results.keys()):
             result = self.sampling_results[size]
@@ -447,17 +1684,21 @@ class EfficientTaxiSamplingExperiment:
                     'Card_Error': sample_result['card_error']
                 })
 
-        detailed_df = pd.DataFrame(detailed_data)
-        detailed_df.to_csv('hundred_samples_detailed.csv', index=False)
+        detailed_df = pd.DataFrame(detailed_data, columns=DETAILED_CSV_COLUMNS)
+        detailed_df.to_csv(self.detailed_csv_path, index=False)
 
-        print(f"💾 CSV files saved: 'hundred_samples_summary.csv' and 'hundred_samples_detailed.csv'")
+        self._log(f"💾 CSV files saved: 'hundred_samples_summary.csv' and '{self.detailed_csv_path}'")
 
-def run_real_data_experiment():
-    """Run the complete real data sampling experiment"""
+def run_real_data_experiment(sample_sizes=None, n_simulations=None, **options):
+    """Run the complete real data sampling experiment; options go to EfficientTaxiSamplingExperiment"""
     print("🚀 NYC Taxi Real Data Sampling Experiment")
     print("=" * 50)
 
-    experiment = EfficientTaxiSamplingExperiment(max_records=1000000)
+    experiment = EfficientTaxiSamplingExperiment(**{'max_records': 1000000, **options})
+    if sample_sizes:
+        experiment.sample_sizes = sample_sizes
+    if n_simulations is not None:
+        experiment.n_simulations = n_simulations
 
     # Step 1: Extract real payment data efficiently
     data = experiment.extract_payment_data_efficiently()
@@ -477,6 +1718,8 @@ def run_real_data_experiment():
             print(f"📁 Files generated:")
             print(f"  • real_data_sampling_analysis.html")
             print(f"  • real_data_sampling_report.txt")
+            if experiment.write_metrics():
+                print(f"  • {experiment.metrics_path}")
 
             return experiment
         else:
@@ -486,5 +1729,90 @@ def run_real_data_experiment():
 
     return None
 
+def main(argv=None):
+    """Command-line entry point: the full experiment, or one of the extract/simulate/report/plot stages"""
+    import argparse
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--workdir', default='taxi_artifacts', help="directory for stage artifacts")
+    common.add_argument('--verbose', type=int, default=2, choices=[0, 1, 2],
+                        help="0 = errors only, 1 = stage progress, 2 = full detail")
+    common.add_argument('--metrics', dest='metrics_path', help="write stage metrics JSON here")
+    common.add_argument('--profile-stage', help="capture this stage with cProfile")
+
+    extract_options = argparse.ArgumentParser(add_help=False)
+    extract_options.add_argument('--max-records', type=int, default=1000000)
+    extract_options.add_argument('--sampling', choices=['head', 'reservoir'], default='head')
+    extract_options.add_argument('--population-mode', choices=['rows', 'histogram'], default='rows')
+    extract_options.add_argument('--sources', choices=['first', 'all'], default='first')
+    extract_options.add_argument('--extract-workers', type=int, default=4)
+    extract_options.add_argument('--dataset-path', help="local directory of .sqlite files (skips the download)")
+    extract_options.add_argument('--chunk-size', type=int, default=100000)
+    extract_options.add_argument('--cache-dir')
+    extract_options.add_argument('--refresh-cache', action='store_true')
+
+    simulate_options = argparse.ArgumentParser(add_help=False)
+    simulate_options.add_argument('--sample-sizes', type=int, nargs='+')
+    simulate_options.add_argument('--n-simulations', type=int, default=100)
+    simulate_options.add_argument('--batch-size', type=int, default=1000)
+    simulate_options.add_argument('--workers', type=int, default=1)
+    simulate_options.add_argument('--streaming-stats', action='store_true')
+    simulate_options.add_argument('--detailed-csv', default='hundred_samples_detailed.csv',
+                                  help="per-simulation CSV path, or 'none' to skip it")
+    simulate_options.add_argument('--tolerance', type=float)
+    simulate_options.add_argument('--max-simulations-per-size', type=int, default=100000)
+    simulate_options.add_argument('--method', choices=['monte_carlo', 'exact'], default='monte_carlo')
+    simulate_options.add_argument('--cross-check', action='store_true')
+
+    seed_option = argparse.ArgumentParser(add_help=False)
+    seed_option.add_argument('--seed', type=int)
+
+    parser = argparse.ArgumentParser(description="NYC taxi payment-type sampling experiment")
+    subcommands = parser.add_subparsers(dest='command')
+    subcommands.add_parser('run', parents=[common, extract_options, simulate_options, seed_option],
+                           help="full experiment (the default)")
+    subcommands.add_parser('extract', parents=[common, extract_options, seed_option],
+                           help="extract the payment population into the work directory")
+    subcommands.add_parser('simulate', parents=[common, simulate_options, seed_option],
+                           help="run the sampling sweep on the extracted population")
+    subcommands.add_parser('report', parents=[common], help="write the report and CSV files from saved results")
+    subcommands.add_parser('plot', parents=[common], help="write the interactive visualization from saved results")
+    args = parser.parse_args(argv)
+    options = vars(args)
+    command = options.pop('command') or 'run'
+    workdir = options.pop('workdir', 'taxi_artifacts')
+    sample_sizes = options.pop('sample_sizes', None)
+    n_simulations = options.pop('n_simulations', 100)
+    if options.get('detailed_csv') is not None:
+        detailed_csv = options.pop('detailed_csv')
+        options['detailed_csv_path'] = None if detailed_csv.lower() == 'none' else detailed_csv
+
+    if command == 'run':
+        experiment = run_real_data_experiment(sample_sizes=sample_sizes, n_simulations=n_simulations, **options)
+        return 0 if experiment is not None else 1
+
+    experiment = EfficientTaxiSamplingExperiment(**options)
+    if command == 'extract':
+        if experiment.extract_payment_data_efficiently() is None:
+            return 1
+        experiment.save_population(workdir)
+    elif command == 'simulate':
+        experiment.load_population(workdir)
+        experiment.n_simulations = n_simulations
+        if sample_sizes:
+            experiment.sample_sizes = sample_sizes
+        if not experiment.run_sampling_simulation():
+            return 1
+        experiment.save_results(workdir)
+    else:
+        experiment.load_population(workdir, load_codes=False)
+        experiment.load_results(workdir)
+        if command == 'report':
+            experiment.generate_final_report()
+        else:
+            experiment.create_visualizations()
+    experiment.write_metrics()
+    return 0
+
 if __name__ == "__main__":
-    experiment = run_real_data_experiment()
\ No newline at end of file
+    raise SystemExit(main())
\ No newline at end of file
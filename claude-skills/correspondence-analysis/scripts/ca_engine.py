@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+ca_engine.py
+
+Batch correspondence analysis over flat files — the long format written by
+extract-crosstabs (tabulate.py) and flatten-crosstab (flatten.py). Builds the
+contingency table for a row × column selection straight from the flat file,
+computes coordinates and inertia, and writes one coordinates JSON per map that
+toolkit/correspondence_map.html loads directly (Upload File → .json).
+
+One map is produced per flat file (wave) and per --by value (e.g. market), so
+a whole tracker runs in one call. Tables with more than 200 rows and more
+than 200 columns use a randomized truncated SVD of only the leading
+dimensions, iterated to convergence (exact SVD if its convergence rate shows
+it would not get there sooner than an exact SVD); smaller tables use an
+exact SVD.
+
+Usage:
+    python ca_engine.py --flat <flat.csv> [<flat_w2.csv> ...] --output-dir <dir>
+                        --rows <column> --cols <column>
+                        [--question Q5 Q6 ...] [--row-type response] [--value-type percent]
+                        [--banner-group <group>] [--banner-value <value> ...] [--by banner_value]
+                        [--standardisation raw|double|zscore] [--dims 2] [--svd auto|exact|randomized]
+                        [--row-label Attributes] [--col-label Brands]
+
+--rows / --cols name flat-file columns: question_id, response_option or
+banner_value. For a brand-image grid asked as one question per attribute
+with brands as response options: --rows question_id --cols response_option.
+
+Output: ca_<wave>_<group>.json per map, ca_summary.csv, and a JSON summary
+on stdout.
+"""
+
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+AXIS_COLUMNS = ["question_id", "question_text", "response_option", "banner_group", "banner_value"]
+FLAT_COLUMNS = AXIS_COLUMNS + ["row_type", "value", "value_type"]
+STANDARDISATION = ["raw", "double", "zscore"]
+EXACT_SVD_MAX = 200  # --svd auto: randomized SVD only when rows and columns both exceed this
+SPARSE_ZERO_SHARE = 0.25
+
+
+# ---------- Loading and selection ----------
+
+def read_flat(path: Path) -> pd.DataFrame:
+    """Read a flat file (CSV, Parquet or Excel), keeping only the columns CA needs."""
+    ext = path.suffix.lower()
+    if ext == ".parquet":
+        df = pd.read_parquet(path)
+    elif ext in (".xlsx", ".xls"):
+        df = pd.read_excel(path)
+    else:
+        df = pd.read_csv(path, low_memory=False)
+    missing = [c for c in FLAT_COLUMNS if c not in df.columns and c != "question_text"]
+    if missing:
+        raise ValueError(f"{path.name}: not a flat file — missing columns {missing}")
+    return df[[c for c in FLAT_COLUMNS if c in df.columns]]
+
+
+def select(
+    flat: pd.DataFrame,
+    questions: list[str] | None = None,
+    row_type: str | None = "response",
+    value_type: str | None = None,
+    banner_group: str | None = None,
+    banner_values: list[str] | None = None,
+) -> pd.DataFrame:
+    """Rows of the flat file that feed the contingency tables."""
+    mask = pd.Series(True, index=flat.index)
+    if questions:
+        mask &= flat["question_id"].astype(str).isin(questions)
+    if row_type:
+        mask &= flat["row_type"] == row_type
+    if value_type:
+        mask &= flat["value_type"] == value_type
+    if banner_group:
+        mask &= flat["banner_group"].astype(str) == banner_group
+    if banner_values:
+        mask &= flat["banner_value"].astype(str).isin(banner_values)
+    return flat[mask]
+
+
+def contingency(sub: pd.DataFrame, rows: str, cols: str) -> pd.DataFrame:
+    """
+    Rows × columns table of values, in first-appearance order. Each cell must
+    come from exactly one flat row; duplicates mean the selection is too broad.
+    """
+    dupes = sub.duplicated([rows, cols], keep=False)
+    if dupes.any():
+        example = sub.loc[dupes, [rows, cols]].iloc[0].tolist()
+        raise ValueError(
+            f"{int(dupes.sum())} flat rows share a {rows} × {cols} cell (e.g. {example}) — "
+            f"narrow the selection with --question, --banner-group, --banner-value or --by"
+        )
+    values = pd.to_numeric(sub["value"], errors="coerce")
+    table = pd.Series(values.to_numpy(), index=pd.MultiIndex.from_frame(sub[[rows, cols]])).unstack(cols)
+    return table.reindex(index=pd.unique(sub[rows]), columns=pd.unique(sub[cols]))
+
+
+# ---------- Correspondence analysis ----------
+
+def standardise(data: np.ndarray, mode: str) -> np.ndarray:
+    """The browser map's standardisation modes (offset by 10 to keep cells positive)."""
+    if mode == "raw":
+        return data.copy()
+    if mode == "zscore":
+        mu = data.mean(axis=1, keepdims=True)
+        sd = data.std(axis=1, keepdims=True)
+        sd[sd == 0] = 1
+        return (data - mu) / sd + 10
+    if mode == "double":
+        row_mean = data.mean(axis=1, keepdims=True)
+        col_mean = data.mean(axis=0, keepdims=True)
+        return data - row_mean - col_mean + row_mean.mean() + 10
+    raise ValueError(f"Unknown standardisation: {mode}")
+
+
+def randomized_svd(
+    a: np.ndarray,
+    k: int,
+    n_oversamples: int = 20,
+    tol: float = 1e-8,
+    max_iter: int | None = None,
+    seed: int = 0,
+):
+    """
+    Leading k singular triplets by randomized subspace iteration (Halko,
+    Martinsson & Tropp 2011), on the tall orientation. Power iterations run
+    until every triplet's residual |Av - su| is below tol × s. Returns None as
+    soon as the rate the residuals are shrinking at says that will take more
+    than max_iter iterations (near-flat spectra, i.e. noise-like tables), so
+    the caller can fall back to an exact SVD having wasted only a couple.
+    """
+    transpose = a.shape[0] < a.shape[1]
+    if transpose:
+        a = a.T
+    rng = np.random.default_rng(seed)
+    width = min(k + n_oversamples, a.shape[1])
+    if max_iter is None:
+        # An iteration costs about width / min(m, n) of an exact SVD: spend at most half of one
+        max_iter = max(4, a.shape[1] // (2 * width))
+    q, _ = np.linalg.qr(a @ rng.standard_normal((a.shape[1], width)))
+    previous = None
+    for i in range(1, max_iter + 1):
+        ub, sketch, vt = np.linalg.svd(q.T @ a, full_matrices=False)
+        u, s, vt = (q @ ub)[:, :k], sketch[:k], vt[:k]
+        error = (np.linalg.norm(a @ vt.T - u * s, axis=0) / np.maximum(s, np.finfo(float).tiny)).max()
+        if error <= tol:
+            if transpose:
+                u, vt = vt.T, u.T
+            return u, s, vt
+        # Each iteration shrinks the residuals by about (s_width / s_k)^2; estimate
+        # that from the sketch until two iterations show the actual rate
+        rate = (sketch[-1] / max(sketch[k - 1], np.finfo(float).tiny)) ** 2 if previous is None else error / previous
+        if rate >= 1 or (rate > 0 and i + np.log(tol / error) / np.log(rate) > max_iter):
+            return None
+        previous = error
+        q, _ = np.linalg.qr(a.T @ q)
+        q, _ = np.linalg.qr(a @ q)
+    return None
+
+
+def truncated_svd(a: np.ndarray, k: int, method: str = "auto"):
+    """Leading k singular triplets, with signs fixed so maps are stable across runs and waves."""
+    if method == "auto":
+        method = "exact" if min(a.shape) <= EXACT_SVD_MAX else "randomized"
+    if method not in ("exact", "randomized"):
+        raise ValueError(f"Unknown SVD method: {method}")
+    triplets = randomized_svd(a, k) if method == "randomized" else None
+    if triplets is None:
+        # Exact, or randomized iteration did not converge (near-flat spectrum)
+        u, s, vt = np.linalg.svd(a, full_matrices=False)
+        triplets = u[:, :k], s[:k], vt[:k]
+    u, s, vt = triplets
+    # Largest-magnitude column loading of each dimension points positive
+    signs = np.sign(vt[np.arange(len(s)), np.abs(vt).argmax(axis=1)])
+    signs[signs == 0] = 1
+    return u * signs, s, vt * signs[:, None]
+
+
+def correspondence_analysis(data: np.ndarray, dims: int = 2, svd: str = "auto") -> dict:
+    """
+    Symmetric CA map: row and column principal coordinates from the SVD of the
+    standardised residuals, with principal inertias as a share of the total.
+    """
+    p = data / data.sum()
+    r = p.sum(axis=1)
+    c = p.sum(axis=0)
+    expected = np.outer(r, c)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.where(expected > 0, (p - expected) / np.sqrt(expected), 0.0)
+    total = float((s ** 2).sum())
+
+    k = max(1, min(dims, min(data.shape) - 1))
+    u, sv, vt = truncated_svd(s, k, svd)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        row_coords = np.where(r[:, None] > 0, u * sv / np.sqrt(r)[:, None], 0.0)
+        col_coords = np.where(c[:, None] > 0, vt.T * sv / np.sqrt(c)[:, None], 0.0)
+    principal = sv ** 2
+    return {
+        "row_coords": row_coords,
+        "col_coords": col_coords,
+        "row_mass": r,
+        "col_mass": c,
+        "total_inertia": total,
+        "principal_inertia": principal,
+        "percent": principal / total * 100 if total > 0 else np.zeros_like(principal),
+    }
+
+
+def prepare_table(table: pd.DataFrame) -> tuple[pd.DataFrame, list[str]]:
+    """Drop empty rows/columns and fill missing cells, recording each fix as a warning."""
+    warnings = []
+    empty_rows = table.index[table.isna().all(axis=1) | (table.fillna(0) == 0).all(axis=1)]
+    empty_cols = table.columns[table.isna().all(axis=0) | (table.fillna(0) == 0).all(axis=0)]
+    if len(empty_rows):
+        warnings.append(f"Dropped {len(empty_rows)} empty row(s): {', '.join(map(str, empty_rows[:5]))}")
+    if len(empty_cols):
+        warnings.append(f"Dropped {len(empty_cols)} empty column(s): {', '.join(map(str, empty_cols[:5]))}")
+    table = table.drop(index=empty_rows, columns=empty_cols)
+    n_missing = int(table.isna().sum().sum())
+    if n_missing:
+        warnings.append(f"{n_missing} missing cell(s) treated as 0")
+        table = table.fillna(0)
+    if table.size and (table == 0).to_numpy().mean() > SPARSE_ZERO_SHARE:
+        warnings.append(f"Sparse table: more than {SPARSE_ZERO_SHARE:.0%} of cells are zero — map may be unreliable")
+    return table, warnings
+
+
+def run_map(table: pd.DataFrame, standardisation: str = "raw", dims: int = 2, svd: str = "auto") -> dict:
+    """CA for one contingency table, with the checks the browser tool applies."""
+    table, warnings = prepare_table(table)
+    if table.shape[0] < 2 or table.shape[1] < 2:
+        raise ValueError(f"Need at least 2 rows and 2 columns after cleaning, got {table.shape[0]} × {table.shape[1]}")
+    if (table.to_numpy() < 0).any():
+        raise ValueError("Negative values — CA needs non-negative input")
+    data = standardise(table.to_numpy(dtype=float), standardisation)
+    if (data < 0).any():
+        raise ValueError("Standardised data has negatives — try a different method or raw")
+    if data.sum() == 0:
+        raise ValueError("All zeros")
+    result = correspondence_analysis(data, dims, svd)
+    result["rows"] = [str(v) for v in table.index]
+    result["cols"] = [str(v) for v in table.columns]
+    result["warnings"] = warnings
+    return result
+
+
+# ---------- Export ----------
+
+def _xy(coords: np.ndarray) -> list[list[float]]:
+    """First two dimensions, padded with 0 for a one-dimensional solution (as the map expects)."""
+    xy = np.zeros((coords.shape[0], 2))
+    xy[:, : min(2, coords.shape[1])] = coords[:, :2]
+    return xy.round(6).tolist()
+
+
+def coordinates_json(result: dict, title: str, meta: dict) -> dict:
+    """
+    The browser map's coordinates file. rowCoords/colCoords/ie are what it
+    plots; ie is each dimension's share of total inertia, so Dim 1 + Dim 2 is
+    the share of the table the 2D map shows. All --dims coordinates go under
+    "dimensions".
+    """
+    percent = result["percent"].tolist()
+    return {
+        "title": title,
+        **meta,
+        "rows": result["rows"],
+        "cols": result["cols"],
+        "rowCoords": _xy(result["row_coords"]),
+        "colCoords": _xy(result["col_coords"]),
+        "ie": [round(v, 4) for v in (percent + [0.0, 0.0])[:2]],
+        "inertia": {
+            "total": result["total_inertia"],
+            "principal": result["principal_inertia"].tolist(),
+            "percent": percent,
+        },
+        "rowMass": result["row_mass"].round(6).tolist(),
+        "colMass": result["col_mass"].round(6).tolist(),
+        "dimensions": {
+            "rowCoords": result["row_coords"].round(6).tolist(),
+            "colCoords": result["col_coords"].round(6).tolist(),
+        },
+        "warnings": result["warnings"],
+    }
+
+
+def _slug(*parts) -> str:
+    text = "_".join(str(p) for p in parts if p not in (None, ""))
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_") or "map"
+
+
+# ---------- Main ----------
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flat", required=True, nargs="+", help="Flat file(s); one map set per file (wave)")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--rows", required=True, choices=AXIS_COLUMNS, help="Flat column giving the map's rows")
+    parser.add_argument("--cols", required=True, choices=AXIS_COLUMNS, help="Flat column giving the map's columns")
+    parser.add_argument("--question", nargs="+", default=None, help="question_id(s) to include")
+    parser.add_argument("--row-type", default="response", help="row_type to include (default: response; '' for all)")
+    parser.add_argument("--value-type", default=None, help="value_type to include (e.g. percent)")
+    parser.add_argument("--banner-group", default=None)
+    parser.add_argument("--banner-value", nargs="+", default=None)
+    parser.add_argument("--by", default=None, choices=AXIS_COLUMNS, help="One map per value of this column")
+    parser.add_argument("--standardisation", default="raw", choices=STANDARDISATION)
+    parser.add_argument("--dims", type=int, default=2)
+    parser.add_argument("--svd", default="auto", choices=["auto", "exact", "randomized"])
+    parser.add_argument("--row-label", default="Attributes")
+    parser.add_argument("--col-label", default="Brands")
+    args = parser.parse_args()
+
+    if args.rows == args.cols or args.by in (args.rows, args.cols):
+        print("ERROR: --rows, --cols and --by must be different columns", file=sys.stderr)
+        sys.exit(1)
+
+    out_dir = Path(args.output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    flat_paths = [Path(p) for p in args.flat]
+    selection = {
+        "rows": args.rows,
+        "cols": args.cols,
+        "question": args.question,
+        "row_type": args.row_type or None,
+        "value_type": args.value_type,
+        "banner_group": args.banner_group,
+        "banner_value": args.banner_value,
+        "by": args.by,
+    }
+
+    summary, used = [], set()
+    for flat_path in flat_paths:
+        wave = flat_path.stem if len(flat_paths) > 1 else None
+        sub = select(
+            read_flat(flat_path),
+            questions=args.question,
+            row_type=args.row_type or None,
+            value_type=args.value_type,
+            banner_group=args.banner_group,
+            banner_values=args.banner_value,
+        )
+        groups = sub.groupby(args.by, sort=False) if args.by else [(None, sub)]
+        for group, part in groups:
+            slug = _slug("ca", wave, group)
+            while slug in used:
+                slug += "_"
+            used.add(slug)
+            entry = {"map": slug, "flat": str(flat_path), "wave": wave, "group": group}
+            try:
+                result = run_map(contingency(part, args.rows, args.cols), args.standardisation, args.dims, args.svd)
+            except ValueError as e:
+                summary.append({**entry, "status": "error", "message": str(e)})
+                continue
+
+            title = " · ".join(str(p) for p in (wave, group) if p is not None) or flat_path.stem
+            meta = {
+                "wave": wave,
+                "group": None if group is None else str(group),
+                "rowLabel": args.row_label,
+                "colLabel": args.col_label,
+                "standardisation": args.standardisation,
+                "selection": selection,
+            }
+            path = out_dir / f"{slug}.json"
+            path.write_text(json.dumps(coordinates_json(result, title, meta), indent=2), encoding="utf-8")
+            percent = result["percent"]
+            summary.append(
+                {
+                    **entry,
+                    "status": "ok",
+                    "output": str(path),
+                    "n_rows": len(result["rows"]),
+                    "n_cols": len(result["cols"]),
+                    "total_inertia": round(result["total_inertia"], 6),
+                    "dim1_pct": round(float(percent[0]), 2),
+                    "dim2_pct": round(float(percent[1]), 2) if len(percent) > 1 else None,
+                    "map_pct": round(float(percent[:2].sum()), 2),
+                    "message": "; ".join(result["warnings"]),
+                }
+            )
+
+    summary_path = out_dir / "ca_summary.csv"
+    pd.DataFrame(summary).to_csv(summary_path, index=False, encoding="utf-8-sig")
+    print(
+        json.dumps(
+            {
+                "maps_written": sum(1 for s in summary if s["status"] == "ok"),
+                "errors": [{"map": s["map"], "message": s["message"]} for s in summary if s["status"] == "error"],
+                "summary": str(summary_path),
+            },
+            indent=2,
+            default=str,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1035 @@
+#!/usr/bin/env python3
+"""
+tabulate.py
+
+Deterministic tabulation engine. Reads raw respondent data + a config JSON and
+produces a flat-format file in the Path A schema (long and wide), plus a
+methodology note.
+
+Banner membership is coded once per respondent frame; each question's
+weighted and unweighted cells and bases for every banner cut then come from
+one matrix product with its response indicators.
+
+With --incremental, each question's rows are cached in the output directory,
+keyed by its config, the banners, the weight variable and a fingerprint of
+the data columns it reads. A re-run recomputes only the questions whose key
+changed and rebuilds the outputs from the cache.
+
+Usage:
+    python tabulate.py --input <data> --config <config.json> --output-dir <dir>
+                       [--codebook <cb.csv>] [--incremental [--cache-dir <dir>]]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+
+# ---------------- Data loading ----------------
+
+def load_data(filepath: str) -> pd.DataFrame:
+    path = Path(filepath)
+    ext = path.suffix.lower()
+    if ext == ".sav":
+        import pyreadstat
+        df, _ = pyreadstat.read_sav(filepath)
+        return df
+    elif ext == ".csv":
+        return pd.read_csv(filepath)
+    elif ext in (".xlsx", ".xls"):
+        return pd.read_excel(filepath)
+    else:
+        raise ValueError(f"Unsupported file type: {ext}")
+
+
+# ---------------- Base / filter helpers ----------------
+
+def apply_filter(df: pd.DataFrame, filter_expr: str) -> pd.DataFrame:
+    """Apply a Python expression as a row filter."""
+    if not filter_expr:
+        return df
+    try:
+        mask = df.eval(filter_expr)
+        return df[mask]
+    except Exception as e:
+        raise ValueError(f"Filter expression failed: {filter_expr} — {e}")
+
+
+def get_weight_series(df: pd.DataFrame, weight_var: str | None) -> pd.Series:
+    """Return a Series of weights (ones if no weight var)."""
+    if weight_var and weight_var in df.columns:
+        w = df[weight_var].fillna(0)
+        if (w < 0).any():
+            raise ValueError(f"Weight variable '{weight_var}' contains negative values.")
+        return w
+    return pd.Series(np.ones(len(df)), index=df.index)
+
+
+# ---------------- Banner coding ----------------
+
+def iter_banner_cuts(df: pd.DataFrame, banners: list[dict]):
+    """Yield (banner_group, banner_value, banner_label, filter_series) tuples."""
+    for banner in banners:
+        group = banner["group_name"]
+        var = banner.get("variable")
+        for value in banner["values"]:
+            label = value["label"]
+            code = value["code"]
+            if var is None:  # Total
+                mask = pd.Series(True, index=df.index)
+            else:
+                mask = df[var] == code
+            yield group, label, mask
+
+
+def _flag(mask) -> np.ndarray:
+    """Boolean mask (Series or array) as a float 0/1 array; missing counts as False."""
+    if isinstance(mask, pd.Series):
+        mask = mask.to_numpy(dtype=bool, na_value=False)
+    return np.asarray(mask, dtype=np.float64)
+
+
+class BannerCuts:
+    """
+    Banner membership coded once per respondent frame.
+
+    `membership` is an (n_respondents × n_cuts) 0/1 matrix with one column per
+    cut in iter_banner_cuts order, so every weighted and unweighted cell count
+    of a question comes out of one matrix product with its indicator columns.
+    """
+
+    def __init__(self, cuts: list[tuple[str, Any]], membership: np.ndarray):
+        self.cuts = cuts
+        self.membership = membership
+        self.sizes = membership.sum(axis=0).tolist()
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, banners: list[dict]) -> "BannerCuts":
+        cuts, columns = [], []
+        for group, label, mask in iter_banner_cuts(df, banners):
+            cuts.append((group, label))
+            columns.append(_flag(mask))
+        membership = np.column_stack(columns) if columns else np.zeros((len(df), 0))
+        return cls(cuts, membership)
+
+    def subset(self, positions: np.ndarray) -> "BannerCuts":
+        """Membership for a row subset of the frame (e.g. a conditional base)."""
+        return BannerCuts(self.cuts, self.membership[positions])
+
+    def counts(self, indicators: np.ndarray, weights: np.ndarray) -> tuple[list, list]:
+        """Weighted and unweighted counts of each indicator column within each cut (n_cuts × n_columns)."""
+        weighted = self.membership.T @ (indicators * weights[:, None])
+        unweighted = self.membership.T @ indicators
+        return weighted.tolist(), unweighted.tolist()
+
+
+def code_indicators(values: pd.Series, codes: list) -> list[np.ndarray]:
+    """
+    One 0/1 column per code, in code order. The values are coded against the
+    code list once (position of the matching code, or none) instead of being
+    compared to every code in turn; matching follows `values == code`.
+    """
+    unique = pd.Index(codes).unique()
+    coded = unique.get_indexer(values)
+    coded[values.isna().to_numpy()] = -1
+    one_hot = np.zeros((len(values), len(unique) + 1))
+    one_hot[np.arange(len(values)), coded] = 1  # unmatched (-1) lands in the spare last column
+    return [one_hot[:, unique.get_loc(code)] for code in codes]
+
+
+# ---------------- Cell computation ----------------
+
+def _weight_array(weights: pd.Series) -> np.ndarray:
+    return weights.to_numpy(dtype=np.float64)
+
+
+def _tabulate_columns(cuts: BannerCuts, weights: np.ndarray, base: np.ndarray, columns: list[np.ndarray]):
+    """
+    Bases and cell counts of a question for every cut in a single reduction.
+
+    `base` flags the question's base; `columns` are indicator columns already
+    restricted to it. Returns weighted and unweighted per-cut bases and
+    per-cut lists of weighted cell counts.
+    """
+    indicators = np.column_stack([base] + columns)
+    weighted, unweighted = cuts.counts(indicators, weights)
+    base_n = [row[0] for row in weighted]
+    base_n_unw = [int(row[0]) for row in unweighted]
+    return base_n, base_n_unw, [row[1:] for row in weighted]
+
+
+def _valid_values(values: pd.Series, base: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Numeric values and the flag of base rows with a non-missing value."""
+    x = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    return x, base * ~np.isnan(x)
+
+
+def _weighted_means(cuts: BannerCuts, weights: np.ndarray, values: pd.Series, base: np.ndarray) -> tuple[list, list]:
+    """
+    Per-cut weighted mean and standard deviation of the non-missing values in
+    base; None where their weight is zero (or, for the SD, at most one).
+    Each cut is summed in row order exactly as np.average does, so means that
+    land on a rounding boundary round the same way as before.
+    """
+    x, valid = _valid_values(values, base)
+    members = cuts.membership.T * valid > 0
+    means, sds = [], []
+    for rows in members:
+        w = weights[rows]
+        total = w.sum()
+        if total == 0:
+            means.append(None)
+            sds.append(None)
+            continue
+        mean = np.multiply(x[rows], w).sum() / total
+        means.append(float(mean))
+        sds.append(float(np.sqrt((w * (x[rows] - mean) ** 2).sum() / (total - 1))) if total > 1 else None)
+    return means, sds
+
+
+def _weighted_medians(cuts: BannerCuts, weights: np.ndarray, values: pd.Series, base: np.ndarray) -> list:
+    """
+    Per-cut weighted median of the non-missing values in base: the first value,
+    in sorted order, whose cumulative weight reaches half the cut's total.
+    Values are sorted once for all cuts; None where the total weight is zero.
+    """
+    x, valid = _valid_values(values, base)
+    rows = np.flatnonzero(valid)
+    rows = rows[np.argsort(x[rows], kind="stable")]
+    sorted_x = x[rows]
+    medians = [None] * len(cuts.cuts)
+    if len(rows) == 0:
+        return medians
+
+    # Cumulative weights are (rows × cuts); take the cuts in blocks to bound memory
+    block = max(1, 2 ** 22 // len(rows))
+    for start in range(0, len(cuts.cuts), block):
+        cum_w = np.cumsum(cuts.membership[rows, start:start + block] * weights[rows, None], axis=0)
+        total = cum_w[-1]
+        first = (cum_w >= total / 2).argmax(axis=0)
+        for offset, (t, i) in enumerate(zip(total.tolist(), first.tolist())):
+            if t != 0:
+                medians[start + offset] = float(sorted_x[i])
+    return medians
+
+
+# ---------------- Question type handlers ----------------
+
+def tabulate_single_response(
+    df: pd.DataFrame,
+    weights: pd.Series,
+    q: dict,
+    banners: list[dict],
+    cuts: BannerCuts | None = None,
+) -> list[dict]:
+    rows = []
+    variable = q["variable"]
+    value_codes = q["value_codes"]
+    missing_handling = q.get("missing_handling", "exclude")
+    nets = [d for d in q.get("derived_measures", []) if d["type"] == "net"]
+    cuts = cuts if cuts is not None else BannerCuts.from_frame(df, banners)
+    w = _weight_array(weights)
+
+    values = df[variable]
+    missing = _flag(values.isna())
+    base = 1 - missing if missing_handling == "exclude" else np.ones(len(df))
+    columns = [base * c for c in code_indicators(values, [vc["code"] for vc in value_codes])]
+    columns.append(missing)
+    columns += [base * _flag(values.isin(d["codes"])) for d in nets]
+    base_ns, base_ns_unw, counts = _tabulate_columns(cuts, w, base, columns)
+    n_codes = len(value_codes)
+
+    for (bgroup, bvalue), base_n, base_n_unw, cells, total_base in zip(
+        cuts.cuts, base_ns, base_ns_unw, counts, cuts.sizes
+    ):
+        if base_n == 0:
+            continue
+
+        # Response rows
+        for vc, count in zip(value_codes, cells[:n_codes]):
+            rows.append(
+                _mk_row(
+                    q, "response", vc["label"], bgroup, bvalue,
+                    count / base_n * 100, "percent", int(round(base_n)), base_n_unw
+                )
+            )
+
+        # Missing as its own category if requested
+        if missing_handling == "include" and total_base:
+            miss_pct = cells[n_codes] / total_base * 100
+            rows.append(
+                _mk_row(
+                    q, "response", "No answer / missing", bgroup, bvalue,
+                    miss_pct, "percent", int(round(total_base)), int(total_base)
+                )
+            )
+
+        # Derived (NETs)
+        for d, net_count in zip(nets, cells[n_codes + 1:]):
+            rows.append(
+                _mk_row(
+                    q, "net", d["label"], bgroup, bvalue,
+                    net_count / base_n * 100, "percent", int(round(base_n)), base_n_unw
+                )
+            )
+    return rows
+
+
+def tabulate_multi_response(
+    df: pd.DataFrame, weights: pd.Series, q: dict, banners: list[dict], cuts: BannerCuts | None = None
+) -> list[dict]:
+    rows = []
+    variables = q["variables"]  # list of column names
+    option_labels = q.get("option_labels", variables)
+    missing_handling = q.get("missing_handling", "exclude")
+    nets = [d for d in q.get("derived_measures", []) if d["type"] == "net"]
+    cuts = cuts if cuts is not None else BannerCuts.from_frame(df, banners)
+    w = _weight_array(weights)
+
+    # Base: respondents with at least one non-null response across all options
+    if missing_handling == "exclude":
+        base = _flag(df[variables].notna().any(axis=1))
+    else:
+        base = np.ones(len(df))
+    options = list(zip(variables, option_labels))
+    # "Selected" = value == 1 (standard binary convention)
+    columns = [base * _flag(df[var] == 1) for var, _ in options]
+    # NETs: union of specific options; codes is a list of variable names in this case
+    columns += [base * _flag((df[d.get("variables", d.get("codes", []))] == 1).any(axis=1)) for d in nets]
+    base_ns, base_ns_unw, counts = _tabulate_columns(cuts, w, base, columns)
+
+    for (bgroup, bvalue), base_n, base_n_unw, cells in zip(cuts.cuts, base_ns, base_ns_unw, counts):
+        if base_n == 0:
+            continue
+
+        for (_, label), sel_count in zip(options, cells):
+            rows.append(
+                _mk_row(
+                    q, "response", label, bgroup, bvalue,
+                    sel_count / base_n * 100, "percent", int(round(base_n)), base_n_unw
+                )
+            )
+
+        for d, net_count in zip(nets, cells[len(options):]):
+            rows.append(
+                _mk_row(
+                    q, "net", d["label"], bgroup, bvalue,
+                    net_count / base_n * 100, "percent", int(round(base_n)), base_n_unw
+                )
+            )
+    return rows
+
+
+def tabulate_scale(
+    df: pd.DataFrame, weights: pd.Series, q: dict, banners: list[dict], cuts: BannerCuts | None = None
+) -> list[dict]:
+    rows = []
+    variable = q["variable"]
+    scale_min = q["scale_min"]
+    scale_max = q["scale_max"]
+    missing_handling = q.get("missing_handling", "exclude")
+    derived = q.get("derived_measures", [])
+    cuts = cuts if cuts is not None else BannerCuts.from_frame(df, banners)
+    w = _weight_array(weights)
+
+    values = df[variable]
+    base = _flag(values.notna()) if missing_handling == "exclude" else np.ones(len(df))
+    points = list(range(scale_min, scale_max + 1))
+    columns = [base * c for c in code_indicators(values, points)]
+
+    # One indicator column per percent-type derived measure, keyed by its position in derived
+    derived_columns = {}
+    for i, d in enumerate(derived):
+        if d["type"] == "net":
+            derived_columns[i] = len(columns)
+            columns.append(base * _flag(values.isin(d["codes"])))
+        elif d["type"] in ("top_box", "bottom_box"):
+            derived_columns[i] = len(columns)
+            columns.append(base * _flag(values == (scale_max if d["type"] == "top_box" else scale_min)))
+    base_ns, base_ns_unw, counts = _tabulate_columns(cuts, w, base, columns)
+
+    derived_types = {d["type"] for d in derived}
+    means, sds = _weighted_means(cuts, w, values, base) if "mean" in derived_types else (None, None)
+    medians = _weighted_medians(cuts, w, values, base) if "median" in derived_types else None
+
+    for c, ((bgroup, bvalue), base_n, base_n_unw, cells) in enumerate(zip(cuts.cuts, base_ns, base_ns_unw, counts)):
+        if base_n == 0:
+            continue
+
+        # Per-scale-point distribution
+        for point, count in zip(points, cells):
+            rows.append(
+                _mk_row(
+                    q, "response", str(point), bgroup, bvalue,
+                    count / base_n * 100, "percent", int(round(base_n)), base_n_unw
+                )
+            )
+
+        # Derived
+        for i, d in enumerate(derived):
+            if d["type"] == "mean":
+                rows.append(
+                    _mk_row(q, "mean", d["label"], bgroup, bvalue, means[c], "mean", int(round(base_n)), base_n_unw,
+                            sd=sds[c])
+                )
+            elif d["type"] == "median":
+                rows.append(
+                    _mk_row(q, "median", d["label"], bgroup, bvalue, medians[c], "median", int(round(base_n)), base_n_unw)
+                )
+            elif i in derived_columns:
+                pct = cells[derived_columns[i]] / base_n * 100
+                rows.append(
+                    _mk_row(q, "net", d["label"], bgroup, bvalue, pct, "percent", int(round(base_n)), base_n_unw)
+                )
+    return rows
+
+
+def tabulate_ranked(
+    df: pd.DataFrame, weights: pd.Series, q: dict, banners: list[dict], cuts: BannerCuts | None = None
+) -> list[dict]:
+    rows = []
+    variables = q["variables"]  # one per rank position
+    rank_positions = q["rank_positions"]
+    value_codes = q["value_codes"]
+    derived = q.get("derived_measures", [])
+    cuts = cuts if cuts is not None else BannerCuts.from_frame(df, banners)
+    w = _weight_array(weights)
+
+    # Base: respondents who provided rank 1 (usually required)
+    base = _flag(df[variables[0]].notna())
+    codes = [vc["code"] for vc in value_codes]
+    # by_position[p][j]: respondent ranked option j at position p
+    by_position = [code_indicators(df[var], codes) for var in variables]
+    positions = list(zip(by_position, rank_positions))
+
+    # Per option: one column per rank position, then the columns its derived measures need
+    columns, layout = [], []
+    for j in range(len(value_codes)):
+        entry = {"ranks": len(columns)}
+        columns += [base * indicators[j] for indicators, _ in positions]
+        for d in derived:
+            if d["type"] == "any_mention":
+                entry["any_mention"] = len(columns)
+                columns.append(base * np.maximum.reduce([indicators[j] for indicators in by_position]))
+            elif d["type"] == "mean_rank":
+                # Mentions and the sum of mentioned rank positions, per respondent
+                entry["mean_rank"] = len(columns)
+                columns.append(base * sum(indicators[j] for indicators, _ in positions))
+                columns.append(base * sum(indicators[j] * float(pos) for indicators, pos in positions))
+        layout.append(entry)
+    indicators = np.column_stack([base] + columns)
+    weighted, unweighted = cuts.counts(indicators, w)
+
+    for (bgroup, bvalue), cell_w, cell_u in zip(cuts.cuts, weighted, unweighted):
+        base_n, base_n_unw = cell_w[0], int(cell_u[0])
+        cell_w, cell_u = cell_w[1:], cell_u[1:]
+        if base_n == 0:
+            continue
+
+        # For each option × each rank position
+        for vc, entry in zip(value_codes, layout):
+            option_label = vc["label"]
+            for k, (_, pos) in enumerate(positions):
+                rows.append(
+                    _mk_row(
+                        q, "response", f"{option_label} — Rank {pos}",
+                        bgroup, bvalue, cell_w[entry["ranks"] + k] / base_n * 100, "percent",
+                        int(round(base_n)), base_n_unw,
+                    )
+                )
+
+            # Derived per-option
+            for d in derived:
+                if d["type"] == "any_mention":
+                    rows.append(
+                        _mk_row(
+                            q, "net", f"{option_label} — Any mention",
+                            bgroup, bvalue, cell_w[entry["any_mention"]] / base_n * 100, "percent",
+                            int(round(base_n)), base_n_unw,
+                        )
+                    )
+                elif d["type"] == "mean_rank" and cell_u[entry["mean_rank"]] > 0:
+                    # Mean rank position for this option across respondents
+                    mentions_w = cell_w[entry["mean_rank"]]
+                    # np.float64, as np.average returned, so round() resolves .xx5 ties the same way
+                    mean_rank = np.float64(cell_w[entry["mean_rank"] + 1]) / mentions_w if mentions_w else None
+                    rows.append(
+                        _mk_row(
+                            q, "mean", f"{option_label} — Mean rank",
+                            bgroup, bvalue, mean_rank, "mean", int(round(base_n)), base_n_unw,
+                        )
+                    )
+    return rows
+
+
+def tabulate_numeric_open(
+    df: pd.DataFrame, weights: pd.Series, q: dict, banners: list[dict], cuts: BannerCuts | None = None
+) -> list[dict]:
+    rows = []
+    variable = q["variable"]
+    missing_handling = q.get("missing_handling", "exclude")
+    derived = q.get("derived_measures", [])
+    filter_expr = q.get("filter")
+    cuts = cuts if cuts is not None else BannerCuts.from_frame(df, banners)
+    w = _weight_array(weights)
+
+    values = df[variable]
+    base = _flag(values.notna()) if missing_handling == "exclude" else np.ones(len(df))
+
+    # Optional outlier filter
+    if filter_expr:
+        temp_df = df.rename(columns={variable: "value"})
+        base = base * _flag(temp_df.eval(filter_expr))
+
+    bands = [d for d in derived if d["type"] == "band"]
+    columns = [base * _flag((values >= d["min"]) & (values <= d["max"])) for d in bands]
+    base_ns, base_ns_unw, counts = _tabulate_columns(cuts, w, base, columns)
+
+    derived_types = {d["type"] for d in derived}
+    means, sds = _weighted_means(cuts, w, values, base) if "mean" in derived_types else (None, None)
+    medians = _weighted_medians(cuts, w, values, base) if "median" in derived_types else None
+
+    for c, ((bgroup, bvalue), base_n, base_n_unw, cells) in enumerate(zip(cuts.cuts, base_ns, base_ns_unw, counts)):
+        if base_n == 0:
+            continue
+
+        band_counts = iter(cells)
+        for d in derived:
+            if d["type"] == "mean":
+                rows.append(
+                    _mk_row(q, "mean", d["label"], bgroup, bvalue,
+                            means[c], "mean", int(round(base_n)), base_n_unw, sd=sds[c])
+                )
+            elif d["type"] == "median":
+                rows.append(
+                    _mk_row(q, "median", d["label"], bgroup, bvalue,
+                            medians[c], "median", int(round(base_n)), base_n_unw)
+                )
+            elif d["type"] == "band":
+                band_pct = next(band_counts) / base_n * 100
+                rows.append(
+                    _mk_row(q, "response", d["label"], bgroup, bvalue,
+                            band_pct, "percent", int(round(base_n)), base_n_unw)
+                )
+    return rows
+
+
+# ---------------- Helpers ----------------
+
+# Internal column: standard deviation behind a mean row, used by the t-tests and dropped before output
+SD_COLUMN = "_value_sd"
+
+
+def _mk_row(q, row_type, response_option, bgroup, bvalue, value, value_type, base_n, base_n_unw, sd=None):
+    row = {
+        "source_sheet": q.get("question_id", ""),
+        "question_id": q["question_id"],
+        "question_text": q["question_text"],
+        "row_type": row_type,
+        "response_option": response_option,
+        "banner_group": bgroup,
+        "banner_value": bvalue,
+        "value": round(value, 2) if value is not None and not pd.isna(value) else None,
+        "value_type": value_type,
+        "base_n": base_n,
+        "base_n_unweighted": base_n_unw,
+        "sig_markers": None,
+    }
+    if sd is not None:
+        row[SD_COLUMN] = sd
+    return row
+
+
+# ---------------- Dispatch ----------------
+
+HANDLERS = {
+    "single_response": tabulate_single_response,
+    "multi_response": tabulate_multi_response,
+    "scale": tabulate_scale,
+    "ranked": tabulate_ranked,
+    "numeric_open": tabulate_numeric_open,
+}
+
+
+def tabulate_questions(
+    df: pd.DataFrame, weights: pd.Series, config: dict, cache: "TabulationCache | None" = None
+) -> list[dict]:
+    """
+    Long-format rows for every configured question, with banner membership
+    coded once. With a cache, questions whose key is unchanged are read back
+    instead of recomputed.
+    """
+    banners = config["banners"]
+    cuts = None
+
+    all_rows = []
+    for q in config["questions"]:
+        key = cache.key(q) if cache is not None else None
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                all_rows.extend(cached)
+                continue
+        if cuts is None:
+            cuts = BannerCuts.from_frame(df, banners)
+
+        # Conditional base
+        if q.get("conditional_base"):
+            sub_df = apply_filter(df, q["conditional_base"])
+            sub_weights = weights.loc[sub_df.index]
+            sub_cuts = cuts.subset(df.index.get_indexer(sub_df.index)) if df.index.is_unique else None
+        else:
+            sub_df = df
+            sub_weights = weights
+            sub_cuts = cuts
+
+        handler = HANDLERS.get(q["question_type"])
+        if not handler:
+            print(f"WARNING: Unknown question type {q['question_type']} for {q['question_id']} — skipping", file=sys.stderr)
+            continue
+        rows = handler(sub_df, sub_weights, q, banners, cuts=sub_cuts)
+        if key is not None:
+            cache.put(key, rows)
+        all_rows.extend(rows)
+    return all_rows
+
+
+# ---------------- Incremental cache ----------------
+
+CACHE_VERSION = 1
+CACHE_DIRNAME = ".tabulate_cache"
+_IDENTIFIER = re.compile(r"`([^`]+)`|\b([A-Za-z_][A-Za-z0-9_]*)\b")
+
+
+def _digest(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _json_default(o):
+    if isinstance(o, np.generic):
+        return o.item()
+    return str(o)
+
+
+def question_columns(df: pd.DataFrame, q: dict) -> list[str]:
+    """
+    Data columns a question reads: its variable(s), the component columns of
+    its derived measures (multi_response NETs name them in "variables", or in
+    "codes"), and any column named in its expressions.
+    """
+    names = [q["variable"]] if q.get("variable") else []
+    names += list(q.get("variables") or [])
+    for d in q.get("derived_measures", []):
+        for field in ("variable", "variables", "codes"):
+            value = d.get(field)
+            names += value if isinstance(value, list) else [value]
+    for expr in (q.get("conditional_base"), q.get("filter")):
+        if expr:
+            names += [quoted or bare for quoted, bare in _IDENTIFIER.findall(expr)]
+    return sorted({n for n in names if isinstance(n, str) and n in df.columns})
+
+
+def frame_digest(frame: pd.DataFrame) -> str:
+    """Content hash of a DataFrame (values, index and column labels)."""
+    return _digest(list(map(str, frame.columns)), pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+
+
+class TabulationCache:
+    """
+    Per-question result cache for incremental runs.
+
+    A question's key hashes its config, the banner definitions, the weight
+    variable, the tabulation code itself, the rows of the (base-filtered)
+    frame, and the contents of every column the question, the banners and the
+    weights read. Cached rows are stored one JSON file per key; keys not used
+    by a run are pruned when it finishes.
+    """
+
+    def __init__(self, cache_dir: Path, df: pd.DataFrame, config: dict):
+        self.dir = Path(cache_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.df = df
+        self._column_digests = {}
+        weight_var = config.get("weight_variable")
+        shared = [b["variable"] for b in config["banners"] if b.get("variable")]
+        if weight_var:
+            shared.append(weight_var)
+        self._shared = _digest(
+            CACHE_VERSION,
+            Path(__file__).read_bytes(),
+            config["banners"],
+            weight_var,
+            pd.util.hash_pandas_object(df.index).to_numpy().tobytes(),
+            self._columns_digest(shared),
+        )
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _columns_digest(self, columns: list[str]) -> dict:
+        out = {}
+        for col in sorted(set(columns)):
+            if col not in self.df.columns:
+                out[col] = None
+                continue
+            if col not in self._column_digests:
+                series = self.df[col]
+                self._column_digests[col] = _digest(
+                    str(series.dtype), pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes()
+                )
+            out[col] = self._column_digests[col]
+        return out
+
+    def key(self, q: dict) -> str:
+        return _digest(self._shared, q, self._columns_digest(question_columns(self.df, q)))
+
+    def _path(self, key: str) -> Path:
+        return self.dir / f"{key}.json"
+
+    def get(self, key: str) -> list[dict] | None:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.used.add(key)
+        self.hits += 1
+        return rows
+
+    def put(self, key: str, rows: list[dict]):
+        self.misses += 1
+        self.used.add(key)
+        tmp = self._path(key).with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(rows, f, default=_json_default)
+        os.replace(tmp, self._path(key))
+
+    def output_current(self, path: Path, digest: str) -> bool:
+        """True if path was last written by a run from a frame with this digest and is untouched since."""
+        recorded = self._outputs().get(str(Path(path).resolve()))
+        return (
+            recorded is not None
+            and recorded["digest"] == digest
+            and Path(path).exists()
+            and os.stat(path).st_mtime_ns == recorded["mtime_ns"]
+        )
+
+    def record_output(self, path: Path, digest: str):
+        outputs = self._outputs()
+        outputs[str(Path(path).resolve())] = {"digest": digest, "mtime_ns": os.stat(path).st_mtime_ns}
+        (self.dir / "outputs.json").write_text(json.dumps(outputs, indent=2), encoding="utf-8")
+
+    def _outputs(self) -> dict:
+        try:
+            return json.loads((self.dir / "outputs.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def prune(self):
+        """Drop cached questions this run did not use."""
+        for path in self.dir.glob("*.json"):
+            if path.stem not in self.used and path.name != "outputs.json":
+                path.unlink()
+
+
+# ---------------- Significance testing ----------------
+
+SIG_CHUNK_PAIRS = 1_000_000  # cell pairs per broadcast; bounds each float64 temporary to ~8 MB
+
+def banner_letters(flat: pd.DataFrame) -> pd.Series:
+    """Column letter of each row's banner value: A, B, ... in order of first appearance within its banner group."""
+    pairs = flat[["banner_group", "banner_value"]].drop_duplicates()
+    letters = pairs.assign(
+        letter=[chr(ord("A") + i) for i in pairs.groupby("banner_group", sort=False).cumcount()]
+    )
+    return flat[["banner_group", "banner_value"]].merge(
+        letters, on=["banner_group", "banner_value"], how="left"
+    )["letter"].set_axis(flat.index)
+
+
+def _z_proportion_matrix(p: np.ndarray, n: np.ndarray, z_crit: float) -> np.ndarray:
+    """
+    Pooled two-proportion z-tests for every ordered pair of cells in each group:
+    out[g, i, j] is True where cell i is significantly above cell j.
+    """
+    p1, p2 = p[:, :, None], p[:, None, :]
+    n1, n2 = n[:, :, None], n[:, None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p_pool = (p1 * n1 + p2 * n2) / (n1 + n2)
+        se = np.sqrt(p_pool * (1 - p_pool) * (1 / n1 + 1 / n2))
+        z = (p1 - p2) / se
+    return (n1 > 0) & (n2 > 0) & (se > 0) & (z > z_crit)
+
+
+def _t_mean_matrix(mean: np.ndarray, sd: np.ndarray, n: np.ndarray, confidence: float) -> np.ndarray:
+    """
+    Welch two-sample t-tests for every ordered pair of mean cells in each group:
+    out[g, i, j] is True where mean i is significantly above mean j.
+    """
+    from scipy.stats import t as t_dist
+
+    m1, m2 = mean[:, :, None], mean[:, None, :]
+    n1, n2 = n[:, :, None], n[:, None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        v1, v2 = (sd ** 2 / n)[:, :, None], (sd ** 2 / n)[:, None, :]
+        se = np.sqrt(v1 + v2)
+        t = (m1 - m2) / se
+        dof = (v1 + v2) ** 2 / (v1 ** 2 / (n1 - 1) + v2 ** 2 / (n2 - 1))
+        t_crit = t_dist.ppf(1 - (1 - confidence) / 2, dof)
+    return (n1 > 1) & (n2 > 1) & (se > 0) & (t > t_crit)
+
+
+def apply_significance_testing(flat: pd.DataFrame, sig_config: dict) -> pd.DataFrame:
+    """
+    Compute column-to-column significance and populate sig_markers.
+
+    Compares each banner value's cell to every other banner value in the same
+    banner_group, per question × response: pooled z-tests on percent rows
+    (test_type "z_proportion" or "both") and Welch t-tests on mean rows that
+    carry a standard deviation ("t_mean" or "both"). Groups with the same
+    number of cells are stacked into (groups × cells) matrices, so pairwise
+    statistics come from one broadcast per chunk of at most SIG_CHUNK_PAIRS
+    cell pairs; markers are written back in one step.
+    """
+    if not sig_config or not sig_config.get("enabled"):
+        return flat
+
+    from scipy.stats import norm
+
+    confidence = sig_config.get("confidence_level", 0.95)
+    z_crit = norm.ppf(1 - (1 - confidence) / 2)
+    test_type = sig_config.get("test_type", "z_proportion")
+    run_z = test_type in ("z_proportion", "both")
+    run_t = test_type in ("t_mean", "both") and SD_COLUMN in flat.columns
+
+    # Only run on percent or mean rows, grouped by question, response, banner_group, value_type
+    relevant = flat[flat["value_type"].isin(["percent", "mean"])]
+    keys = ["question_id", "response_option", "banner_group", "value_type"]
+    group_id = relevant.groupby(keys, sort=False).ngroup().to_numpy()
+    relevant, group_id = relevant[group_id >= 0], group_id[group_id >= 0]
+    if relevant.empty:
+        return flat
+
+    value = pd.to_numeric(relevant["value"], errors="coerce").to_numpy(dtype=np.float64)
+    n = pd.to_numeric(relevant["base_n"], errors="coerce").to_numpy(dtype=np.float64)
+    sd = pd.to_numeric(relevant[SD_COLUMN], errors="coerce").to_numpy(dtype=np.float64) if run_t else None
+    letter_codes = banner_letters(flat).loc[relevant.index].map(ord).to_numpy() - ord("A")
+    group_is_mean = np.zeros(group_id.max() + 1, dtype=bool)
+    group_is_mean[group_id] = (relevant["value_type"] == "mean").to_numpy()
+
+    # Cells of each group are contiguous in `order`, in order of appearance
+    sizes = np.bincount(group_id)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    order = np.argsort(group_id, kind="stable")
+
+    marked_rows, markers = [], []
+    for width in np.unique(sizes[sizes > 1]):
+        not_self = ~np.eye(width, dtype=bool)
+        step = max(1, SIG_CHUNK_PAIRS // (width * width))
+        for is_mean, enabled in ((False, run_z), (True, run_t)):
+            if not enabled:
+                continue
+            groups = np.flatnonzero((sizes == width) & (group_is_mean == is_mean))
+            for chunk_start in range(0, len(groups), step):
+                cells = order[starts[groups[chunk_start:chunk_start + step]][:, None] + np.arange(width)]
+                if is_mean:
+                    significant = _t_mean_matrix(value[cells], sd[cells], n[cells], confidence)
+                else:
+                    significant = _z_proportion_matrix(value[cells] / 100, n[cells], z_crit)
+                significant &= not_self
+
+                # Letters each cell beats: hit[g, i, letter], then joined in letter order
+                letters = letter_codes[cells]
+                g, i, j = np.nonzero(significant)
+                hit = np.zeros(cells.shape + (letters.max() + 1,), dtype=bool)
+                hit[g, i, letters[g, j]] = True
+                marked = hit.any(axis=2)
+                alphabet = np.array([chr(ord("A") + k) for k in range(hit.shape[2])])
+                marked_rows.append(cells[marked])
+                markers += ["".join(alphabet[row]) for row in hit[marked]]
+
+    # Apply markers back to the full flat dataframe
+    if markers:
+        flat.loc[relevant.index[np.concatenate(marked_rows)], "sig_markers"] = markers
+
+    return flat
+
+
+# ---------------- Output ----------------
+
+def write_methodology_note(config: dict, out_path: Path, row_count: int, base_n: int):
+    lines = [
+        f"# Methodology — {config.get('study_id', 'study')}",
+        "",
+        f"Run at: {datetime.now().isoformat(timespec='seconds')}",
+        f"Wave: {config.get('wave', '(not specified)')}",
+        "",
+        "## Sample",
+        "",
+        f"- Total rows in raw file: {row_count}",
+        f"- Base (qualified respondents): {base_n}",
+        f"- Base filter: `{config.get('base_filter', 'none')}`",
+        "",
+        "## Weighting",
+        "",
+    ]
+    if config.get("weight_variable"):
+        lines += [
+            f"- Weighted tabulations: **yes**",
+            f"- Weight variable: `{config['weight_variable']}`",
+            f"- Weighting scheme: {config.get('weighting_description', '(not described)')}",
+        ]
+    else:
+        lines += ["- Weighted tabulations: **no** (unweighted)"]
+    lines += ["", "## Banners", ""]
+    for b in config["banners"]:
+        lines.append(f"- **{b['group_name']}** (variable: `{b.get('variable', 'N/A')}`)")
+        for v in b["values"]:
+            lines.append(f"  - {v['label']} (code: {v['code']})")
+    lines += ["", "## Questions tabulated", ""]
+    for q in config["questions"]:
+        lines.append(f"- **{q['question_id']}** — {q['question_text']} ({q['question_type']})")
+        if q.get("conditional_base"):
+            lines.append(f"  - Conditional base: `{q['conditional_base']}`")
+        if q.get("missing_handling"):
+            lines.append(f"  - Missing handling: {q['missing_handling']}")
+        for d in q.get("derived_measures", []):
+            lines.append(f"  - Derived: {d.get('label', d['type'])}")
+    if config.get("significance", {}).get("enabled"):
+        sc = config["significance"]
+        lines += [
+            "",
+            "## Significance testing",
+            "",
+            f"- Test type: {sc.get('test_type', 'z_proportion')}",
+            f"- Confidence level: {int(sc.get('confidence_level', 0.95) * 100)}%",
+            f"- Multiple-comparison correction: {sc.get('correction', 'none')}",
+        ]
+    else:
+        lines += ["", "## Significance testing", "", "- Not applied"]
+    out_path.write_text("\n".join(lines), encoding="utf-8")
+
+
+def pivot_to_wide(long_df: pd.DataFrame) -> pd.DataFrame:
+    if long_df.empty:
+        return long_df
+    long_df = long_df.copy()
+    long_df["banner_col"] = long_df["banner_group"] + "_" + long_df["banner_value"].astype(str)
+    index_cols = [
+        "source_sheet",
+        "question_id",
+        "question_text",
+        "row_type",
+        "response_option",
+        "value_type",
+    ]
+    wide = long_df.pivot_table(
+        index=index_cols,
+        columns="banner_col",
+        values="value",
+        aggfunc="first",
+    ).reset_index()
+    return wide
+
+
+# ---------------- Main ----------------
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--config", required=True)
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--codebook", default=None)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reuse cached results for questions whose config and data are unchanged",
+    )
+    parser.add_argument("--cache-dir", default=None, help=f"Cache directory (default: <output-dir>/{CACHE_DIRNAME})")
+    parser.add_argument(
+        "--format",
+        nargs="+",
+        choices=["csv", "xlsx"],
+        default=["csv", "xlsx"],
+        help="Output formats for the flat files (default: csv xlsx)",
+    )
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+
+    df = load_data(args.input)
+    original_rows = len(df)
+
+    # Base filter
+    if config.get("base_filter"):
+        df = apply_filter(df, config["base_filter"])
+    base_n = len(df)
+
+    weights = get_weight_series(df, config.get("weight_variable"))
+
+    out_dir = Path(args.output_dir)
+    cache = None
+    if args.incremental:
+        cache = TabulationCache(Path(args.cache_dir) if args.cache_dir else out_dir / CACHE_DIRNAME, df, config)
+
+    flat = pd.DataFrame(tabulate_questions(df, weights, config, cache))
+
+    # Significance testing
+    if config.get("significance", {}).get("enabled"):
+        flat = apply_significance_testing(flat, config["significance"])
+    flat = flat.drop(columns=[SD_COLUMN], errors="ignore")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = config.get("study_id", "study")
+    wave = config.get("wave", "")
+    if wave:
+        stem = f"{stem}_{wave}"
+
+    # Long and wide; an incremental run leaves outputs whose content is unchanged
+    outputs = {}
+    for name, frame in (("long", flat), ("wide", pivot_to_wide(flat))):
+        digest = frame_digest(frame) if cache is not None else None
+        for fmt in args.format:
+            path = out_dir / f"flat_{stem}_{name}.{fmt}"
+            outputs[f"{name}_{fmt}"] = str(path)
+            if cache is not None and cache.output_current(path, digest):
+                continue
+            if fmt == "csv":
+                frame.to_csv(path, index=False, encoding="utf-8-sig")
+            else:
+                frame.to_excel(path, index=False)
+            if cache is not None:
+                cache.record_output(path, digest)
+
+    # Methodology
+    method_path = out_dir / f"methodology_{stem}.md"
+    write_methodology_note(config, method_path, original_rows, base_n)
+
+    result = {
+        "rows_written": len(flat),
+        "unique_questions": flat["question_id"].nunique() if not flat.empty else 0,
+        "base_n": base_n,
+        "outputs": {**outputs, "methodology": str(method_path)},
+    }
+    if cache is not None:
+        cache.prune()
+        result["questions_recomputed"] = cache.misses
+        result["questions_cached"] = cache.hits
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
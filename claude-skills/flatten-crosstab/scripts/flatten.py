@@ -0,0 +1,558 @@
+#!/usr/bin/env python3
+"""
+flatten.py
+
+Deterministically flattens a crosstab file into the long/wide format specified
+in reference/output-schema.md. Accepts a configuration JSON describing the
+file's structure (produced by inspect + analyst confirmation) and writes the
+flat output + data dictionary to disk.
+
+Usage:
+    python flatten.py --input <file> --config <json> --output-dir <dir> [--shape long|wide|both]
+                      [--format csv xlsx parquet] [--workers N]
+
+The workbook is parsed once and read one sheet at a time. Sheets can be
+flattened in parallel (--workers), and long-format rows are appended to the
+outputs sheet by sheet, so memory stays bounded by the sheets in flight.
+The wide shape pivots the whole table and therefore still holds it in memory.
+"""
+
+import argparse
+import json
+import re
+import sys
+from collections import deque
+from pathlib import Path
+
+import pandas as pd
+
+
+# ---------- Helpers ----------
+
+NET_PATTERNS = [r"^\s*NET\b", r"^\s*NETS?\s*[:\-]"]
+SUBTOTAL_PATTERNS = [r"^\s*SUBTOTAL", r"^\s*SUB\s*TOTAL", r"^\s*TOTAL\s*$"]
+MEAN_PATTERNS = [r"^\s*MEAN\b", r"^\s*AVERAGE\b", r"^\s*AVG\b", r"\bMEAN SCORE\b"]
+MEDIAN_PATTERNS = [r"^\s*MEDIAN\b"]
+
+
+def classify_row_type(label: str) -> str:
+    """Classify a row based on its label."""
+    if not isinstance(label, str):
+        return "response"
+    text = label.strip().upper()
+    for p in NET_PATTERNS:
+        if re.search(p, text):
+            return "net"
+    for p in SUBTOTAL_PATTERNS:
+        if re.search(p, text):
+            return "subtotal"
+    for p in MEAN_PATTERNS:
+        if re.search(p, text):
+            return "mean"
+    for p in MEDIAN_PATTERNS:
+        if re.search(p, text):
+            return "median"
+    return "response"
+
+
+def parse_value(raw, sig_handling: str):
+    """
+    Parse a cell value. Returns (value, sig_markers).
+    sig_handling: 'strip' | 'preserve' | 'inline'
+    """
+    if raw is None or (isinstance(raw, float) and pd.isna(raw)):
+        return None, None
+    if isinstance(raw, (int, float)):
+        return float(raw), None
+    s = str(raw).strip()
+    if s in ("", "-", "*", "N/A", "n/a", "NA"):
+        return None, None
+    # Match: optional minus, number, optional %, optional sig letters
+    m = re.match(r"^\s*(-?\d+(?:\.\d+)?)\s*%?\s*([A-Za-z]{1,4})?\s*$", s)
+    if m:
+        val = float(m.group(1))
+        sig = m.group(2) if m.group(2) else None
+        if sig_handling == "inline":
+            return s, None  # keep as-is
+        return val, sig
+    # Fallback: try a direct float cast
+    try:
+        return float(s.replace("%", "").strip()), None
+    except ValueError:
+        return None, None
+
+
+def detect_value_type(label: str) -> str:
+    """Guess value_type from the row label."""
+    if not isinstance(label, str):
+        return "percent"
+    t = label.strip().upper()
+    if any(re.search(p, t) for p in MEAN_PATTERNS):
+        return "mean"
+    if any(re.search(p, t) for p in MEDIAN_PATTERNS):
+        return "mean"  # stored as numeric; median labelled via row_type
+    return "percent"
+
+
+def is_question_row(label: str, prev_was_response: bool) -> bool:
+    """
+    Heuristic: a row is a question if it's a long string (>30 chars) or starts
+    with Q-number pattern. Also true if the previous row was blank and this
+    row has content.
+    """
+    if not isinstance(label, str):
+        return False
+    s = label.strip()
+    if not s:
+        return False
+    if len(s) > 30:
+        return True
+    if re.match(r"^Q\d+", s, re.IGNORECASE):
+        return True
+    if re.match(r"^\d+\.\s", s):
+        return True
+    return False
+
+
+# ---------- Core flattening ----------
+
+LONG_COLUMNS = [
+    "source_sheet",
+    "question_id",
+    "question_text",
+    "row_type",
+    "response_option",
+    "banner_group",
+    "banner_value",
+    "value",
+    "value_type",
+    "base_n",
+    "sig_markers",
+]
+
+
+def flatten_sheet(
+    df: pd.DataFrame,
+    sheet_name: str,
+    config: dict,
+    sig_handling: str,
+) -> pd.DataFrame:
+    """Flatten a single sheet using the provided config."""
+    return pd.DataFrame(list(iter_flat_rows(df, sheet_name, config, sig_handling)))
+
+
+def iter_flat_rows(
+    df: pd.DataFrame,
+    sheet_name: str,
+    config: dict,
+    sig_handling: str,
+):
+    """Yield the long-format rows of a single sheet, one dict per non-empty cell."""
+    banner_group_row = config.get("banner_group_row", 0)
+    banner_value_row = config.get("banner_value_row", 1)
+    base_size_row = config.get("base_size_row")
+    question_col = config.get("question_column", 0)
+    data_start_row = config.get("data_start_row", banner_value_row + 1)
+    if base_size_row is not None and base_size_row >= data_start_row:
+        data_start_row = base_size_row + 1
+
+    # Build banner map: col_index -> (banner_group, banner_value, base_n)
+    banner_map = {}
+    group_row_raw = df.iloc[banner_group_row] if banner_group_row < len(df) else pd.Series()
+    value_row_raw = df.iloc[banner_value_row] if banner_value_row < len(df) else pd.Series()
+    base_row_raw = (
+        df.iloc[base_size_row] if base_size_row is not None and base_size_row < len(df) else pd.Series()
+    )
+
+    # Forward-fill banner group across columns (for merged cells that pandas reads as NaN)
+    current_group = "Total"
+    for col in range(len(df.columns)):
+        if col == question_col:
+            continue
+        group_val = group_row_raw.iloc[col] if col < len(group_row_raw) else None
+        if pd.notna(group_val) and str(group_val).strip():
+            current_group = str(group_val).strip()
+        banner_value = value_row_raw.iloc[col] if col < len(value_row_raw) else None
+        if pd.isna(banner_value) or not str(banner_value).strip():
+            continue
+        banner_value = str(banner_value).strip()
+
+        base_n = None
+        if len(base_row_raw) > col:
+            base_raw = base_row_raw.iloc[col]
+            if pd.notna(base_raw):
+                if isinstance(base_raw, (int, float)):
+                    base_n = int(base_raw)
+                else:
+                    m = re.search(r"(\d+)", str(base_raw))
+                    if m:
+                        base_n = int(m.group(1))
+
+        banner_map[col] = {
+            "banner_group": current_group,
+            "banner_value": banner_value,
+            "base_n": base_n,
+        }
+
+    # Walk data rows, forward-filling question text
+    current_question_text = None
+    current_question_id = None
+    q_counter = 0
+    grid = df.to_numpy(dtype=object)  # plain cell values; no per-row Series construction
+
+    for row_idx in range(data_start_row, len(df)):
+        row = grid[row_idx]
+        label_raw = row[question_col] if question_col < len(row) else None
+        if pd.isna(label_raw):
+            continue
+        label = str(label_raw).strip()
+        if not label:
+            continue
+
+        # Is this a new question?
+        if is_question_row(label, prev_was_response=False):
+            current_question_text = label
+            # Extract Q-id if present; otherwise auto-number
+            m = re.match(r"^(Q\d+[a-z]?)", label, re.IGNORECASE)
+            if m:
+                current_question_id = m.group(1).upper()
+            else:
+                q_counter += 1
+                current_question_id = f"Q{q_counter}"
+            continue
+
+        # Otherwise treat as a response row
+        if current_question_text is None:
+            # Response row before any question detected — skip with no-op
+            continue
+
+        row_type = classify_row_type(label)
+        value_type = detect_value_type(label)
+
+        for col, banner_info in banner_map.items():
+            if col >= len(row):
+                continue
+            cell = row[col]
+            value, sig = parse_value(cell, sig_handling)
+            if value is None and sig is None:
+                continue  # skip fully empty cells
+
+            yield {
+                "source_sheet": sheet_name,
+                "question_id": current_question_id,
+                "question_text": current_question_text,
+                "row_type": row_type,
+                "response_option": label,
+                "banner_group": banner_info["banner_group"],
+                "banner_value": banner_info["banner_value"],
+                "value": value,
+                "value_type": value_type,
+                "base_n": banner_info["base_n"],
+                "sig_markers": sig if sig_handling == "preserve" else None,
+            }
+
+
+# ---------- Streaming ----------
+
+def iter_sheets(input_path: Path, config: dict):
+    """
+    Yield (sheet_name, sheet_config, df) one sheet at a time. Workbooks are
+    opened once (read-only for .xlsx) and each sheet parsed from that handle,
+    instead of re-reading the whole file per sheet.
+    """
+    suffix = input_path.suffix.lower()
+    if suffix in (".xlsx", ".xls"):
+        with pd.ExcelFile(input_path) as xl:
+            for sheet_name in xl.sheet_names:
+                # Allow per-sheet config override
+                sheet_config = config.get("sheets", {}).get(sheet_name, config.get("default", {}))
+                yield sheet_name, sheet_config, xl.parse(sheet_name, header=None)
+    elif suffix == ".csv":
+        yield "csv", config.get("default", {}), pd.read_csv(input_path, header=None)
+    else:
+        raise ValueError(f"Unsupported file type: {input_path.suffix}")
+
+
+def flatten_sheets(input_path: Path, config: dict, sig_handling: str, workers: int = 1):
+    """
+    Yield each sheet's long-format DataFrame, in sheet order.
+
+    With workers > 1, sheets are flattened on a process pool while the next
+    ones are read; at most two sheets per worker are in flight at once.
+    """
+    sheets = iter_sheets(input_path, config)
+    if workers <= 1:
+        for sheet_name, sheet_config, df in sheets:
+            yield flatten_sheet(df, sheet_name, sheet_config, sig_handling)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for sheet_name, sheet_config, df in sheets:
+            pending.append(pool.submit(flatten_sheet, df, sheet_name, sheet_config, sig_handling))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class LongWriter:
+    """
+    Incremental long-format writer. Each sheet's rows are appended to the
+    requested formats (csv, xlsx, parquet) as they arrive, and summary counts
+    are kept on the way; with keep=True the rows are also retained for the
+    wide pivot.
+    """
+
+    def __init__(self, output_dir: Path, stem: str, formats: list[str], sig_handling: str, keep: bool = False):
+        self.paths = {fmt: output_dir / f"flat_{stem}_long.{fmt}" for fmt in formats}
+        self.sig_handling = sig_handling
+        self.keep = keep
+        self.kept = []
+        self.rows_written = 0
+        self.question_ids = set()
+        self.banner_groups = set()
+        self.banner_values = set()
+        self._csv = None
+        self._xlsx = None
+        self._xlsx_sheet = None
+        self._parquet = None
+
+    def _normalize(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Fixed column order and dtypes, so every sheet appends with the same schema."""
+        chunk = chunk.reindex(columns=LONG_COLUMNS)
+        chunk["base_n"] = chunk["base_n"].astype("Int64")
+        if self.sig_handling != "inline":
+            chunk["value"] = chunk["value"].astype("float64")
+        return chunk
+
+    def write(self, chunk: pd.DataFrame):
+        if chunk.empty:
+            return
+        chunk = self._normalize(chunk)
+        if "csv" in self.paths:
+            if self._csv is None:
+                self._csv = open(self.paths["csv"], "w", encoding="utf-8-sig", newline="")
+            chunk.to_csv(self._csv, index=False, header=self.rows_written == 0)
+        if "xlsx" in self.paths:
+            if self._xlsx is None:
+                from openpyxl import Workbook
+
+                self._xlsx = Workbook(write_only=True)
+                self._xlsx_sheet = self._xlsx.create_sheet("Sheet1")
+                self._xlsx_sheet.append(LONG_COLUMNS)
+            for record in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False):
+                self._xlsx_sheet.append(list(record))
+        if "parquet" in self.paths:
+            import pyarrow as pa
+
+            if self._parquet is None:
+                import pyarrow.parquet as pq
+
+                schema = pa.schema(
+                    [(col, pa.string()) for col in LONG_COLUMNS[:7]]
+                    + [("value", pa.string() if self.sig_handling == "inline" else pa.float64()),
+                       ("value_type", pa.string()), ("base_n", pa.int64()), ("sig_markers", pa.string())]
+                )
+                self._parquet = pq.ParquetWriter(self.paths["parquet"], schema)
+            table = chunk
+            if self.sig_handling == "inline":
+                # Inline values mix numbers and source text; Parquet needs one string column
+                table = chunk.assign(value=chunk["value"].map(lambda v: v if v is None or isinstance(v, str) else str(v)))
+            self._parquet.write_table(pa.Table.from_pandas(table, schema=self._parquet.schema, preserve_index=False))
+
+        self.rows_written += len(chunk)
+        self.question_ids.update(chunk["question_id"].dropna())
+        self.banner_groups.update(chunk["banner_group"].dropna())
+        self.banner_values.update(chunk["banner_value"].dropna())
+        if self.keep:
+            self.kept.append(chunk)
+
+    def close(self) -> dict:
+        """Finish every output; returns {"long_<format>": path}."""
+        if self._csv is not None:
+            self._csv.close()
+        if self._xlsx is not None:
+            self._xlsx.save(self.paths["xlsx"])
+        if self._parquet is not None:
+            self._parquet.close()
+        return {f"long_{fmt}": str(path) for fmt, path in self.paths.items() if self.rows_written}
+
+    def consolidated(self) -> pd.DataFrame:
+        return pd.concat(self.kept, ignore_index=True) if self.kept else pd.DataFrame(columns=LONG_COLUMNS)
+
+
+def write_frame(df: pd.DataFrame, path_stem: Path, formats: list[str]) -> dict:
+    """Write a whole table in each requested format; returns {format: path}."""
+    outputs = {}
+    for fmt in formats:
+        path = path_stem.with_suffix(f".{fmt}")
+        if fmt == "csv":
+            df.to_csv(path, index=False, encoding="utf-8-sig")
+        elif fmt == "xlsx":
+            df.to_excel(path, index=False)
+        elif fmt == "parquet":
+            df.to_parquet(path, index=False)
+        outputs[fmt] = str(path)
+    return outputs
+
+
+def pivot_to_wide(long_df: pd.DataFrame) -> pd.DataFrame:
+    """Convert long format to wide format."""
+    if long_df.empty:
+        return long_df
+    # Build composite column name: banner_group_banner_value
+    long_df = long_df.copy()
+    long_df["banner_col"] = long_df["banner_group"] + "_" + long_df["banner_value"]
+
+    index_cols = [
+        "source_sheet",
+        "question_id",
+        "question_text",
+        "row_type",
+        "response_option",
+        "value_type",
+    ]
+    wide = long_df.pivot_table(
+        index=index_cols,
+        columns="banner_col",
+        values="value",
+        aggfunc="first",
+    ).reset_index()
+
+    # Add base_n columns per banner cut
+    base_df = (
+        long_df[["banner_col", "base_n"]]
+        .drop_duplicates()
+        .set_index("banner_col")["base_n"]
+    )
+    for col in base_df.index:
+        wide[f"{col}_base_n"] = base_df[col]
+
+    return wide
+
+
+def build_data_dictionary(df: pd.DataFrame) -> pd.DataFrame:
+    """Build a data dictionary for the flat output."""
+    rows = []
+    descriptions = {
+        "source_sheet": ("string", "Sheet name in the original file", "Any string"),
+        "question_id": ("string", "Question identifier (auto-generated if absent)", "Q1, Q2, ..."),
+        "question_text": ("string", "Verbatim question text from source", "Any string"),
+        "row_type": (
+            "string",
+            "Classification of the row",
+            "response | net | subtotal | mean | median",
+        ),
+        "response_option": ("string", "Row label (response option or NET/mean)", "Any string"),
+        "banner_group": ("string", "Banner group name", "Total, Gender, Age, Market, ..."),
+        "banner_value": ("string", "Specific cut within the banner group", "Total, Male, 18-24, ..."),
+        "value": ("float", "Numeric value", "Stripped of sig markers if requested"),
+        "value_type": ("string", "Kind of measure in value", "percent | mean | count"),
+        "base_n": ("integer", "Base size for this banner value", "From banner plan; may be null"),
+        "sig_markers": ("string", "Significance letters if preserved", "Null unless preservation requested"),
+    }
+    for col in df.columns:
+        if col in descriptions:
+            t, d, a = descriptions[col]
+            rows.append({"column_name": col, "type": t, "description": d, "allowed_values": a, "notes": ""})
+        else:
+            # wide-format banner columns
+            rows.append(
+                {
+                    "column_name": col,
+                    "type": "float" if col.endswith("_base_n") is False else "integer",
+                    "description": "Wide-format banner cut value" if not col.endswith("_base_n") else "Base size for banner cut",
+                    "allowed_values": "Numeric",
+                    "notes": "",
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+# ---------- Main ----------
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", required=True, help="Path to crosstab file")
+    parser.add_argument("--config", required=True, help="Path to run config JSON")
+    parser.add_argument("--output-dir", required=True, help="Output directory")
+    parser.add_argument(
+        "--shape",
+        default="long",
+        choices=["long", "wide", "both"],
+        help="Output shape (default: long)",
+    )
+    parser.add_argument(
+        "--sig-handling",
+        default="strip",
+        choices=["strip", "preserve", "inline"],
+        help="How to handle significance markers",
+    )
+    parser.add_argument(
+        "--format",
+        nargs="+",
+        default=["csv", "xlsx"],
+        choices=["csv", "xlsx", "parquet"],
+        help="Output formats for the flat files (default: csv xlsx)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes flattening sheets in parallel (default: 1)",
+    )
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    config_path = Path(args.config)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(config_path) as f:
+        config = json.load(f)
+
+    if input_path.suffix.lower() not in (".xlsx", ".xls", ".csv"):
+        print(f"ERROR: Unsupported file type: {input_path.suffix}", file=sys.stderr)
+        sys.exit(1)
+
+    stem = input_path.stem
+    wide = args.shape in ("wide", "both")
+    long_formats = args.format if args.shape in ("long", "both") else []
+    writer = LongWriter(output_dir, stem, long_formats, args.sig_handling, keep=wide)
+
+    # Stream sheets: each one is flattened and appended before the next is held
+    for long_df in flatten_sheets(input_path, config, args.sig_handling, workers=args.workers):
+        writer.write(long_df)
+    outputs = writer.close()
+
+    if not writer.rows_written:
+        print("ERROR: No data flattened. Check the config and file structure.", file=sys.stderr)
+        sys.exit(1)
+
+    # Write wide format
+    if wide:
+        wide_df = pivot_to_wide(writer.consolidated())
+        for fmt, path in write_frame(wide_df, output_dir / f"flat_{stem}_wide", args.format).items():
+            outputs[f"wide_{fmt}"] = path
+
+    # Write data dictionary (based on long format since it has all canonical columns)
+    dict_df = build_data_dictionary(pd.DataFrame(columns=LONG_COLUMNS))
+    dict_csv = output_dir / f"dictionary_{stem}.csv"
+    dict_df.to_csv(dict_csv, index=False, encoding="utf-8-sig")
+    outputs["dictionary"] = str(dict_csv)
+
+    summary = {
+        "rows_written": writer.rows_written,
+        "unique_questions": len(writer.question_ids),
+        "unique_banner_groups": len(writer.banner_groups),
+        "unique_banner_values": len(writer.banner_values),
+        "outputs": outputs,
+    }
+    print(json.dumps(summary, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,600 @@
+#!/usr/bin/env python3
+"""
+validate.py
+
+Runs all four validation checks against a flat file and writes a human-readable
+markdown report.
+
+The flat file is read once, in row chunks (CSV or Parquet), and each chunk is
+folded into the grouped aggregates the checks need — so million-row files are
+never held in memory whole and no check loops over groups in Python.
+
+Usage:
+    python validate.py --flat <flat.csv|flat.parquet> [--banner-plan <banner_plan.csv>] --output <report.md>
+                       [--chunksize 250000]
+"""
+
+import argparse
+import json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+MULTI_RESPONSE_KEYWORDS = [
+    "select all",
+    "multiple",
+    "any of",
+    "all that apply",
+    "more than one",
+]
+
+
+# Columns the checks read; labels are read as text so chunks agree on dtypes,
+# and sorted numerically where a column reads as numbers (see _sort_key)
+FLAT_COLUMNS = [
+    "question_id",
+    "question_text",
+    "row_type",
+    "response_option",
+    "banner_group",
+    "banner_value",
+    "value",
+    "value_type",
+    "base_n",
+]
+TEXT_COLUMNS = [c for c in FLAT_COLUMNS if c not in ("value", "base_n")]
+PCT_KEYS = ["question_id", "question_text", "banner_group", "banner_value"]
+CUT_KEYS = ["question_id", "banner_group", "banner_value"]
+DEFAULT_CHUNKSIZE = 250_000
+
+
+def is_multi_response(question_text: str) -> bool:
+    if not isinstance(question_text, str):
+        return False
+    t = question_text.lower()
+    return any(k in t for k in MULTI_RESPONSE_KEYWORDS)
+
+
+# ---------- Single-pass scan ----------
+
+def read_flat_chunks(flat_path: Path, chunksize: int = DEFAULT_CHUNKSIZE):
+    """Yield the flat file in row chunks, restricted to the columns the checks read."""
+    flat_path = Path(flat_path)
+    if flat_path.suffix.lower() == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(flat_path).iter_batches(batch_size=chunksize, columns=FLAT_COLUMNS):
+            chunk = batch.to_pandas()
+            for col in TEXT_COLUMNS:
+                chunk[col] = chunk[col].astype(str).astype(object).where(chunk[col].notna(), np.nan)
+            yield chunk
+    else:
+        yield from pd.read_csv(
+            flat_path, usecols=FLAT_COLUMNS, dtype={c: str for c in TEXT_COLUMNS}, chunksize=chunksize
+        )
+
+
+def _reads_as_numbers(values) -> bool:
+    """Whether read_csv would infer a numeric dtype for these non-null labels."""
+    return bool(pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").notna().all())
+
+
+def _sort_key(numeric: list[bool]):
+    """
+    Sort key for label tuples that orders them as groupby, merge and sorted()
+    would on read_csv's inferred dtypes: numerically in columns that read as
+    numbers (so "2" comes before "10"), as text otherwise.
+    """
+    return lambda key: tuple(float(v) if num else v for v, num in zip(key, numeric))
+
+
+class _GroupCodes:
+    """
+    Integer ids for key tuples, stable across chunks. Rows with a null key get
+    -1, as groupby drops them.
+    """
+
+    def __init__(self, columns: list[str]):
+        self.columns = columns
+        self.ids = {}
+        self.keys = []
+
+    def encode(self, chunk: pd.DataFrame) -> np.ndarray:
+        local = chunk.groupby(self.columns, sort=False, dropna=True).ngroup().to_numpy()
+        valid = local >= 0
+        if not valid.any():
+            return np.full(len(chunk), -1, dtype=np.int64)
+        _, first = np.unique(local[valid], return_index=True)
+        first_rows = np.flatnonzero(valid)[first]
+        glob = np.empty(len(first_rows), dtype=np.int64)
+        for i, key in enumerate(chunk[self.columns].iloc[first_rows].itertuples(index=False, name=None)):
+            glob[i] = self.ids.get(key, -1)
+            if glob[i] < 0:
+                glob[i] = self.ids[key] = len(self.keys)
+                self.keys.append(key)
+        return np.where(valid, glob[np.maximum(local, 0)], -1)
+
+    def rank(self, numeric: dict[str, bool]) -> np.ndarray:
+        """Each id's position in sorted key order (groupby's group order)."""
+        key = _sort_key([numeric[col] for col in self.columns])
+        rank = np.empty(len(self.keys), dtype=np.int64)
+        rank[sorted(range(len(self.keys)), key=lambda i: key(self.keys[i]))] = np.arange(len(self.keys))
+        return rank
+
+
+def _pairwise_sums(block: np.ndarray) -> np.ndarray:
+    """
+    Row sums of a 2-D block, added in the same order as numpy's pairwise
+    summation of a 1-D array (eight running sums, halved past 128 values),
+    so each row's sum is bit-identical to Series.sum() on that row.
+    """
+    m = block.shape[1]
+    if m < 8:
+        res = np.zeros(block.shape[0])
+        for j in range(m):
+            res += block[:, j]
+        return res
+    if m <= 128:
+        r = block[:, :8].copy()
+        full = m - m % 8
+        for i in range(8, full, 8):
+            r += block[:, i:i + 8]
+        res = ((r[:, 0] + r[:, 1]) + (r[:, 2] + r[:, 3])) + ((r[:, 4] + r[:, 5]) + (r[:, 6] + r[:, 7]))
+        for i in range(full, m):
+            res += block[:, i]
+        return res
+    half = m // 2
+    half -= half % 8
+    return _pairwise_sums(block[:, :half]) + _pairwise_sums(block[:, half:])
+
+
+def _group_sums(codes: np.ndarray, values: np.ndarray, n_groups: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per-group row count, null count and sum (nulls skipped). Groups of equal
+    size are summed together as one block, each over its rows in file order,
+    so totals near the ±1 boundaries come out exactly as a per-group sum would.
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    nulls = np.bincount(codes, weights=np.isnan(values), minlength=n_groups).astype(np.int64)
+    sums = np.zeros(n_groups)
+    ordered = values[np.argsort(codes, kind="stable")]
+    ordered = np.where(np.isnan(ordered), 0.0, ordered)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    for size in np.unique(counts[counts > 0]):
+        groups = np.flatnonzero(counts == size)
+        sums[groups] = _pairwise_sums(ordered[starts[groups][:, None] + np.arange(size)])
+    return counts, nulls, sums
+
+
+class FlatScan:
+    """Everything the four checks and the report summary need, gathered in one pass over the flat file."""
+
+    def __init__(self):
+        self.n_rows = 0
+        self.uniques = {"question_id": set(), "banner_group": set(), "banner_value": set()}
+        # Label columns whose every value so far reads as a number
+        self.numeric = dict.fromkeys(PCT_KEYS, True)
+        self._banner_pairs = []
+        self._base_triples = []
+        # Check 2: percent response rows by question × banner cut
+        self.pct_groups = _GroupCodes(PCT_KEYS)
+        self.n_pct_rows = 0
+        self._pct_codes, self._pct_values = [], []
+        # Check 3: response rows and NET rows by question × banner cut
+        self.cut_groups = _GroupCodes(CUT_KEYS)
+        self.has_nets = False
+        self._resp_codes, self._resp_values = [], []
+        self._nets = []
+
+    @classmethod
+    def from_file(cls, flat_path: Path, chunksize: int = DEFAULT_CHUNKSIZE) -> "FlatScan":
+        scan = cls()
+        for chunk in read_flat_chunks(flat_path, chunksize):
+            scan.add(chunk)
+        return scan
+
+    @classmethod
+    def from_frame(cls, flat: pd.DataFrame) -> "FlatScan":
+        scan = cls()
+        scan.add(flat)
+        return scan
+
+    def add(self, chunk: pd.DataFrame):
+        chunk = chunk.reset_index(drop=True)
+        offset = self.n_rows
+        self.n_rows += len(chunk)
+        for col, seen in self.uniques.items():
+            seen.update(chunk[col].dropna().unique())
+        for col, numeric in self.numeric.items():
+            self.numeric[col] = numeric and _reads_as_numbers(chunk[col].dropna().unique())
+        self._banner_pairs.append(chunk[["banner_group", "banner_value"]].drop_duplicates())
+        self._base_triples.append(chunk[["banner_group", "banner_value", "base_n"]].drop_duplicates())
+
+        values = chunk["value"].to_numpy(dtype=float, na_value=np.nan)
+        row_type = chunk["row_type"]
+
+        pct = ((chunk["value_type"] == "percent") & (row_type == "response")).to_numpy()
+        self.n_pct_rows += int(pct.sum())
+        codes = self.pct_groups.encode(chunk[pct])
+        self._pct_codes.append(codes[codes >= 0])
+        self._pct_values.append(values[pct][codes >= 0])
+
+        codes = self.cut_groups.encode(chunk)
+        resp = (row_type == "response").to_numpy() & (codes >= 0)
+        self._resp_codes.append(codes[resp])
+        self._resp_values.append(values[resp])
+        net = (row_type == "net").to_numpy()
+        self.has_nets = self.has_nets or bool(net.any())
+        net = net & (codes >= 0)
+        if net.any():
+            self._nets.append(
+                pd.DataFrame(
+                    {
+                        "group": codes[net],
+                        "row": offset + np.flatnonzero(net),
+                        "value": values[net],
+                        "response_option": chunk.loc[net, "response_option"].to_numpy(dtype=object),
+                    }
+                )
+            )
+
+    def banner_pairs(self) -> set:
+        return set(pd.concat(self._banner_pairs).drop_duplicates().itertuples(index=False, name=None))
+
+    def base_triples(self) -> pd.DataFrame:
+        """Distinct banner × base_n combinations in file order (as drop_duplicates on the whole file)."""
+        return pd.concat(self._base_triples, ignore_index=True).drop_duplicates().dropna(subset=["base_n"])
+
+    def percent_sums(self):
+        return _group_sums(
+            np.concatenate(self._pct_codes), np.concatenate(self._pct_values), len(self.pct_groups.keys)
+        )
+
+    def response_sums(self):
+        return _group_sums(
+            np.concatenate(self._resp_codes), np.concatenate(self._resp_values), len(self.cut_groups.keys)
+        )
+
+    def nets(self) -> pd.DataFrame:
+        if not self._nets:
+            return pd.DataFrame({"group": [], "row": [], "value": [], "response_option": []})
+        return pd.concat(self._nets, ignore_index=True)
+
+
+# ---------- Checks ----------
+
+def _plan_numeric(scan: FlatScan, banner_plan: pd.DataFrame) -> dict[str, bool]:
+    """Banner columns that read as numbers in both the flat file and the banner plan."""
+    return {
+        col: scan.numeric[col] and _reads_as_numbers(banner_plan[col].dropna().unique())
+        for col in ("banner_group", "banner_value")
+    }
+
+
+def check_base_reconciliation(scan: FlatScan, banner_plan: pd.DataFrame | None) -> dict:
+    """Check 1: banner values' base_n matches the banner plan."""
+    result = {"name": "Base reconciliation", "status": "passed", "issues": []}
+    if banner_plan is None:
+        result["status"] = "skipped"
+        result["issues"].append("No banner plan provided — check skipped.")
+        return result
+
+    actual = scan.base_triples()
+
+    expected = banner_plan[["banner_group", "banner_value", "base_n"]].copy()
+    expected["base_n"] = expected["base_n"].astype("Int64")
+
+    merged = actual.merge(
+        expected,
+        on=["banner_group", "banner_value"],
+        how="outer",
+        suffixes=("_actual", "_expected"),
+        indicator=True,
+    )
+    # merge sorts the keys as text; re-sort them as the inferred dtypes would
+    numeric = _plan_numeric(scan, banner_plan)
+    merged = merged.sort_values(
+        ["banner_group", "banner_value"],
+        key=lambda col: col.astype(float) if numeric[col.name] else col,
+        kind="stable",
+        ignore_index=True,
+    )
+
+    both = merged["base_n_actual"].notna() & merged["base_n_expected"].notna()
+    mismatch = both & (
+        np.trunc(merged["base_n_actual"].astype(float)) != np.trunc(merged["base_n_expected"].astype(float))
+    )
+    kind = merged["_merge"].astype(str)
+    flagged = (kind != "both") | mismatch
+    for bg, bv, n_actual, n_expected, k in zip(
+        merged["banner_group"][flagged],
+        merged["banner_value"][flagged],
+        merged["base_n_actual"][flagged].tolist(),
+        merged["base_n_expected"][flagged].tolist(),
+        kind[flagged],
+    ):
+        if k == "left_only":
+            result["issues"].append(
+                {
+                    "severity": "medium",
+                    "detail": f"{bg} × {bv}: in file but not in banner plan (n={n_actual})",
+                }
+            )
+        elif k == "right_only":
+            result["issues"].append(
+                {
+                    "severity": "high",
+                    "detail": f"{bg} × {bv}: in banner plan (expected n={n_expected}) but missing from file",
+                }
+            )
+        else:
+            result["issues"].append(
+                {
+                    "severity": "medium",
+                    "detail": f"{bg} × {bv}: expected n={n_expected}, got n={n_actual}",
+                }
+            )
+
+    if result["issues"]:
+        severities = {i["severity"] for i in result["issues"] if isinstance(i, dict)}
+        if "high" in severities:
+            result["status"] = "failed"
+        else:
+            result["status"] = "flagged"
+    return result
+
+
+def check_percentage_sums(scan: FlatScan) -> dict:
+    """Check 2: percentages within each question × banner cut sum to 100 (±1)."""
+    result = {"name": "Percentage sum check", "status": "passed", "issues": []}
+
+    if scan.n_pct_rows == 0:
+        result["status"] = "skipped"
+        result["issues"].append("No percentage response rows found.")
+        return result
+
+    keys = scan.pct_groups.keys
+    _, nulls, totals = scan.percent_sums()
+    multi = {qtext: is_multi_response(qtext) for qtext in {k[1] for k in keys}}
+    checked = ~np.array([multi[k[1]] for k in keys], dtype=bool)
+    out_of_range = (totals < 99) | (totals > 101)
+    flagged = checked & ((nulls > 0) | out_of_range)
+
+    order = np.argsort(scan.pct_groups.rank(scan.numeric))
+    for g in order[flagged[order]]:
+        qid, _, bgroup, bvalue = keys[g]
+        if nulls[g]:
+            result["issues"].append(
+                {
+                    "severity": "low",
+                    "detail": f"{qid} × {bgroup} × {bvalue}: nulls present — sum check skipped",
+                }
+            )
+            continue
+        total = totals[g]
+        if not (99 <= total <= 101):
+            severity = "medium" if 95 <= total <= 105 else "high"
+            result["issues"].append(
+                {
+                    "severity": severity,
+                    "detail": f"{qid} × {bgroup} × {bvalue}: sum = {total:.1f} (outside 100 ±1)",
+                }
+            )
+
+    if result["issues"]:
+        severities = {i["severity"] for i in result["issues"] if isinstance(i, dict)}
+        if "high" in severities:
+            result["status"] = "failed"
+        else:
+            result["status"] = "flagged"
+    return result
+
+
+def check_net_integrity(scan: FlatScan) -> dict:
+    """Check 3: NET rows are ≥ sum of component response rows."""
+    result = {"name": "NET integrity", "status": "passed", "issues": []}
+
+    if not scan.has_nets:
+        result["status"] = "skipped"
+        result["issues"].append("No NET rows detected — check skipped.")
+        return result
+
+    # For each question × banner cut, compare NET(s) to sum of response rows.
+    # NET composition is inferred as: all response rows within the same
+    # question × banner cut. This is imperfect — flag as "composition inferred".
+    counts, nulls, sums = scan.response_sums()
+    nets = scan.nets()
+    group = nets["group"].to_numpy(dtype=np.int64)
+    net_values = nets["value"].to_numpy(dtype=float)
+    options = nets["response_option"].to_numpy(dtype=object)
+    response_sum = sums[group]
+    short = (counts[group] > 0) & (nulls[group] == 0) & ~np.isnan(net_values)
+    short &= net_values + 1 < response_sum
+
+    # Report in groupby order: question × banner cut, then file order within it
+    rank = scan.cut_groups.rank(scan.numeric)
+    hits = np.flatnonzero(short)
+    hits = hits[np.lexsort((nets["row"].to_numpy()[hits], rank[group[hits]]))]
+    for i in hits:
+        qid, bgroup, bvalue = scan.cut_groups.keys[group[i]]
+        result["issues"].append(
+            {
+                "severity": "medium",
+                "detail": (
+                    f"{qid} × {bgroup} × {bvalue}: NET '{options[i]}' "
+                    f"= {net_values[i]:.1f}, but response sum = {response_sum[i]:.1f} "
+                    f"(NET composition inferred — may be a false positive)"
+                ),
+            }
+        )
+
+    if result["issues"]:
+        result["status"] = "flagged"
+    return result
+
+
+def check_completeness(scan: FlatScan, banner_plan: pd.DataFrame | None) -> dict:
+    """Check 4: every question × banner cut in the plan appears in the output."""
+    result = {"name": "Completeness", "status": "passed", "issues": []}
+    if banner_plan is None:
+        result["status"] = "skipped"
+        result["issues"].append("No banner plan provided — check skipped.")
+        return result
+
+    # Expected set: (banner_group, banner_value) combinations from plan × all questions in flat
+    expected_banners = set(
+        zip(banner_plan["banner_group"], banner_plan["banner_value"])
+    )
+    actual_banners = scan.banner_pairs()
+
+    numeric = _plan_numeric(scan, banner_plan)
+
+    missing_from_output = expected_banners - actual_banners
+    extra_in_output = actual_banners - expected_banners
+
+    key = _sort_key([numeric["banner_group"], numeric["banner_value"]])
+    for bg, bv in sorted(missing_from_output, key=key):
+        result["issues"].append(
+            {
+                "severity": "high",
+                "detail": f"Missing from output: {bg} × {bv}",
+            }
+        )
+    for bg, bv in sorted(extra_in_output, key=key):
+        result["issues"].append(
+            {
+                "severity": "medium",
+                "detail": f"Present in output but not in banner plan: {bg} × {bv}",
+            }
+        )
+
+    if result["issues"]:
+        severities = {i["severity"] for i in result["issues"] if isinstance(i, dict)}
+        if "high" in severities:
+            result["status"] = "failed"
+        else:
+            result["status"] = "flagged"
+    return result
+
+
+# ---------- Report ----------
+
+STATUS_ICON = {
+    "passed": "✅",
+    "flagged": "⚠️",
+    "failed": "❌",
+    "skipped": "⏭️",
+}
+
+
+def write_report(
+    flat_path: Path,
+    banner_plan_path: Path | None,
+    scan: FlatScan,
+    checks: list[dict],
+    output_path: Path,
+):
+    lines = []
+    lines.append(f"# Validation report — {flat_path.name}")
+    lines.append("")
+    lines.append(f"Run at: {datetime.now().isoformat(timespec='seconds')}")
+    lines.append(f"Flat file: `{flat_path}`")
+    lines.append(
+        f"Banner plan: `{banner_plan_path}`"
+        if banner_plan_path
+        else "Banner plan: not provided"
+    )
+    lines.append("")
+    lines.append("---")
+    lines.append("")
+
+    for check in checks:
+        icon = STATUS_ICON.get(check["status"], "❓")
+        lines.append(f"## {check['name']}")
+        lines.append("")
+        lines.append(f"Status: {icon} {check['status'].title()}")
+        lines.append("")
+        if not check["issues"]:
+            lines.append("No issues.")
+        else:
+            for issue in check["issues"]:
+                if isinstance(issue, dict):
+                    lines.append(
+                        f"- **{issue['severity'].upper()}** — {issue['detail']}"
+                    )
+                else:
+                    lines.append(f"- {issue}")
+        lines.append("")
+        lines.append("---")
+        lines.append("")
+
+    # Summary
+    lines.append("## Summary")
+    lines.append("")
+    lines.append(f"- Total rows in flat file: {scan.n_rows:,}")
+    lines.append(f"- Unique questions: {len(scan.uniques['question_id'])}")
+    lines.append(f"- Unique banner groups: {len(scan.uniques['banner_group'])}")
+    lines.append(f"- Unique banner values: {len(scan.uniques['banner_value'])}")
+    lines.append("")
+
+    all_statuses = [c["status"] for c in checks]
+    if "failed" in all_statuses:
+        overall = "❌ One or more checks failed. Review before proceeding."
+    elif "flagged" in all_statuses:
+        overall = "⚠️ Checks flagged issues. Review before proceeding."
+    elif all(s in ("passed", "skipped") for s in all_statuses):
+        overall = "✅ All executed checks passed."
+    else:
+        overall = "❓ Mixed results."
+    lines.append(f"**Overall: {overall}**")
+    lines.append("")
+
+    output_path.write_text("\n".join(lines), encoding="utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flat", required=True, help="Path to flat CSV or Parquet file")
+    parser.add_argument("--banner-plan", default=None, help="Path to banner plan CSV (optional)")
+    parser.add_argument("--output", required=True, help="Path to write markdown report")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Rows read per chunk")
+    args = parser.parse_args()
+
+    flat_path = Path(args.flat)
+    scan = FlatScan.from_file(flat_path, args.chunksize)
+
+    banner_plan = None
+    banner_plan_path = None
+    if args.banner_plan:
+        banner_plan_path = Path(args.banner_plan)
+        banner_plan = pd.read_csv(banner_plan_path, dtype={"banner_group": str, "banner_value": str})
+        required_cols = {"banner_group", "banner_value", "base_n"}
+        missing = required_cols - set(banner_plan.columns)
+        if missing:
+            print(f"ERROR: banner plan missing columns: {missing}")
+            banner_plan = None
+
+    checks = [
+        check_base_reconciliation(scan, banner_plan),
+        check_percentage_sums(scan),
+        check_net_integrity(scan),
+        check_completeness(scan, banner_plan),
+    ]
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    write_report(flat_path, banner_plan_path, scan, checks, output_path)
+
+    summary = {
+        "report": str(output_path),
+        "statuses": {c["name"]: c["status"] for c in checks},
+        "total_issues": sum(len(c["issues"]) for c in checks),
+    }
+    print(json.dumps(summary, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+flat_store.py
+
+Session-level store for a flat file. The CSV is parsed once and converted to
+a columnar directory next to it (`<flat>.store/`): one memory-mapped .npy
+array per column, string columns as categorical codes, and row indexes on
+question_id, banner_group and banner_value. Later loads map the arrays
+instead of re-parsing the CSV, and equality selections on the indexed
+columns touch only the matching rows.
+
+The store is rebuilt automatically when the CSV's size or modification time
+changes. If it cannot be written (e.g. the CSV sits in a read-only directory),
+the store is built in memory for the current process instead; pass a
+writable --store directory to keep it between runs.
+
+Usage:
+    python flat_store.py --flat <flat.csv> [--store <dir>]   # build (or refresh) the store
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+STORE_VERSION = "1.0"
+INDEX_COLUMNS = ["question_id", "banner_group", "banner_value"]
+
+# Stores opened in this process, by store directory; batch runs share one
+_OPEN_STORES = {}
+
+
+def default_store_path(flat_path) -> Path:
+    flat_path = Path(flat_path)
+    return flat_path.with_name(flat_path.name + ".store")
+
+
+def _fingerprint(flat_path) -> dict:
+    stat = os.stat(flat_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class FlatStore:
+    """
+    Columnar view of a flat file. String columns are held as int32 codes into
+    a category list; other columns keep the dtype pandas parsed them with.
+    select() and take() return ordinary DataFrames with the same dtypes and
+    row labels that pd.read_csv would have produced for those rows.
+    """
+
+    def __init__(self, columns: list[str], arrays: dict, categories: dict, dtypes: dict, indexes: dict,
+                 n_rows: int):
+        self.columns = columns
+        self.arrays = arrays  # column -> codes (categorical) or values
+        self.categories = categories  # categorical column -> object array of categories
+        self.dtypes = dtypes  # categorical column -> dtype read_csv gave it ("object" or "str")
+        self.indexes = indexes  # indexed column -> (order, offsets)
+        self.n_rows = n_rows
+        self._lookups = {}
+
+    # ----- Construction -----
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "FlatStore":
+        """Encode an in-memory flat DataFrame (as read by pd.read_csv)."""
+        arrays, categories, dtypes, indexes = {}, {}, {}, {}
+        for col in df.columns:
+            series = df[col]
+            if series.dtype == object or pd.api.types.is_string_dtype(series):
+                codes, uniques = pd.factorize(series)
+                arrays[col] = codes.astype(np.int32)
+                categories[col] = np.asarray(uniques, dtype=object)
+                dtypes[col] = str(series.dtype)
+            else:
+                arrays[col] = series.to_numpy()
+        for col in INDEX_COLUMNS:
+            if col in categories:
+                indexes[col] = _build_index(arrays[col], len(categories[col]))
+        return cls(list(df.columns), arrays, categories, dtypes, indexes, len(df))
+
+    @classmethod
+    def open(cls, flat_path, store_path=None, rebuild: bool = False) -> "FlatStore":
+        """
+        Store for a flat CSV: reused from this process, else mapped from disk,
+        else built from the CSV (one parse) and written for the next process.
+        If the store directory is not writable, the in-memory store is used.
+        """
+        store_path = Path(store_path) if store_path else default_store_path(flat_path)
+        fingerprint = _fingerprint(flat_path)
+        key = str(store_path.absolute())
+        cached = _OPEN_STORES.get(key)
+        if cached is not None and not rebuild and cached[0] == fingerprint:
+            return cached[1]
+
+        store = None if rebuild else cls.load(store_path, fingerprint)
+        if store is None:
+            built = cls.from_frame(pd.read_csv(flat_path))
+            try:
+                built.save(store_path, fingerprint)
+            except OSError as e:
+                print(f"WARNING: could not write flat store {store_path} ({e}); using it in memory", file=sys.stderr)
+            store = cls.load(store_path, fingerprint) or built
+        _OPEN_STORES[key] = (fingerprint, store)
+        return store
+
+    def save(self, store_path, fingerprint: dict):
+        """
+        Write the store atomically: build in a private temp directory next to
+        it, then swap it in. Concurrent builders each use their own temp
+        directory; if another finishes first, its store is kept.
+        """
+        store_path = Path(store_path)
+        store_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(tempfile.mkdtemp(prefix=store_path.name + ".tmp-", dir=store_path.parent))
+        try:
+            self._write(tmp_path, fingerprint)
+            shutil.rmtree(store_path, ignore_errors=True)
+            try:
+                os.replace(tmp_path, store_path)
+            except OSError:
+                # Another process swapped its store in between our rmtree and replace
+                if not store_path.is_dir():
+                    raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def _write(self, tmp_path: Path, fingerprint: dict):
+        """Column arrays, indexes and meta.json into an empty directory."""
+        for i, col in enumerate(self.columns):
+            np.save(tmp_path / f"col{i}.npy", np.ascontiguousarray(self.arrays[col]))
+        for col, (order, offsets) in self.indexes.items():
+            i = self.columns.index(col)
+            np.save(tmp_path / f"col{i}.order.npy", order)
+            np.save(tmp_path / f"col{i}.offsets.npy", offsets)
+        meta = {
+            "version": STORE_VERSION,
+            "source": fingerprint,
+            "n_rows": self.n_rows,
+            "columns": self.columns,
+            "categories": {col: cats.tolist() for col, cats in self.categories.items()},
+            "dtypes": self.dtypes,
+            "indexes": list(self.indexes),
+        }
+        with open(tmp_path / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, default=str)
+
+    @classmethod
+    def load(cls, store_path, fingerprint: dict | None = None) -> "FlatStore | None":
+        """Map a saved store; None if it is missing, incomplete, from another version, or stale."""
+        store_path = Path(store_path)
+        try:
+            with open(store_path / "meta.json", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != STORE_VERSION:
+            return None
+        if fingerprint is not None and meta.get("source") != fingerprint:
+            return None
+
+        columns = meta["columns"]
+        try:
+            arrays = {col: np.load(store_path / f"col{i}.npy", mmap_mode="r") for i, col in enumerate(columns)}
+            indexes = {}
+            for col in meta["indexes"]:
+                i = columns.index(col)
+                indexes[col] = (
+                    np.load(store_path / f"col{i}.order.npy", mmap_mode="r"),
+                    np.load(store_path / f"col{i}.offsets.npy"),
+                )
+        except (OSError, ValueError):  # replaced by a concurrent rebuild while loading
+            return None
+        categories = {col: np.asarray(cats, dtype=object) for col, cats in meta["categories"].items()}
+        return cls(columns, arrays, categories, meta["dtypes"], indexes, meta["n_rows"])
+
+    # ----- Selection -----
+
+    def _code(self, col: str, value) -> int:
+        """Category code of a value in a categorical column, or -1 if it never occurs."""
+        lookup = self._lookups.get(col)
+        if lookup is None:
+            lookup = self._lookups[col] = {v: i for i, v in enumerate(self.categories[col].tolist())}
+        try:
+            return lookup.get(value, -1)
+        except TypeError:  # unhashable
+            return -1
+
+    def _positions_for(self, col: str, values: list) -> np.ndarray:
+        """Sorted row positions where an indexed column equals one of values."""
+        order, offsets = self.indexes[col]
+        parts = [order[offsets[c]:offsets[c + 1]] for c in (self._code(col, v) for v in values) if c >= 0]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts)) if len(parts) > 1 else np.asarray(parts[0])
+
+    def _matches(self, col: str, positions: np.ndarray, values: list) -> np.ndarray:
+        """Mask over positions where col equals one of values (pandas == / isin semantics)."""
+        if col not in self.arrays:
+            raise KeyError(col)
+        if col in self.categories:
+            wanted = [c for c in (self._code(col, v) for v in values) if c >= 0]
+            return np.isin(self.arrays[col][positions], wanted)
+        return pd.Series(self.arrays[col][positions]).isin(values).to_numpy()
+
+    def positions(self, **filters) -> np.ndarray:
+        """
+        Sorted row positions matching exact-value filters. A list value means
+        "any of"; None means no filter on that column. The most selective
+        indexed filter picks the candidate rows, the rest are checked on them.
+        """
+        filters = {
+            col: list(val) if isinstance(val, (list, tuple)) else [val]
+            for col, val in filters.items() if val is not None
+        }
+        indexed = [col for col in filters if col in self.indexes]
+        if indexed:
+            candidates = min((self._positions_for(col, filters[col]) for col in indexed), key=len)
+        else:
+            candidates = np.arange(self.n_rows)
+        for col, values in filters.items():
+            if len(candidates) == 0:
+                break
+            candidates = candidates[self._matches(col, candidates, values)]
+        return candidates
+
+    def take(self, positions: np.ndarray) -> pd.DataFrame:
+        """Rows at positions as a DataFrame, with read_csv's dtypes and row labels."""
+        positions = np.asarray(positions, dtype=np.int64)
+        data = {}
+        for col in self.columns:
+            values = self.arrays[col][positions]
+            if col in self.categories:
+                decoded = self.categories[col][np.maximum(values, 0)] if len(self.categories[col]) else \
+                    np.empty(len(values), dtype=object)
+                decoded[values < 0] = np.nan
+                values = decoded if self.dtypes[col] == "object" else pd.array(decoded, dtype=self.dtypes[col])
+            data[col] = values
+        return pd.DataFrame(data, index=pd.Index(positions), columns=self.columns)
+
+    def select(self, **filters) -> pd.DataFrame:
+        """Rows matching exact-value filters (see positions()), in file order."""
+        return self.take(self.positions(**filters))
+
+    def column(self, col: str) -> np.ndarray:
+        """A non-categorical column's values for every row (memory-mapped when loaded from disk)."""
+        if col in self.categories:
+            raise TypeError(f"{col} is categorical; use select() or take()")
+        return self.arrays[col]
+
+    def frame(self) -> pd.DataFrame:
+        """The whole flat file as a DataFrame."""
+        return self.take(np.arange(self.n_rows))
+
+
+def _build_index(codes: np.ndarray, n_categories: int) -> tuple[np.ndarray, np.ndarray]:
+    """Row positions grouped by code (file order within a code) and each code's offsets."""
+    valid = codes >= 0
+    order = np.flatnonzero(valid)[np.argsort(codes[valid], kind="stable")]
+    offsets = np.zeros(n_categories + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes[valid], minlength=n_categories), out=offsets[1:])
+    return order.astype(np.int64), offsets
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flat", required=True)
+    parser.add_argument("--store", default=None, help="Store directory (default: <flat>.store next to the CSV)")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild even if the store is current")
+    args = parser.parse_args()
+
+    if not Path(args.flat).exists():
+        print(f"ERROR: Flat file not found: {args.flat}", file=sys.stderr)
+        sys.exit(1)
+    store = FlatStore.open(args.flat, args.store, rebuild=args.rebuild)
+    summary = {
+        "store": str(Path(args.store) if args.store else default_store_path(args.flat)),
+        "rows": store.n_rows,
+        "columns": store.columns,
+        "indexed": list(store.indexes),
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
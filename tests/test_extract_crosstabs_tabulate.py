@@ -0,0 +1,96 @@
+"""Regression fixtures for claude-skills/extract-crosstabs/scripts/tabulate.py."""
+
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+TABULATE = Path(__file__).resolve().parents[1] / "claude-skills" / "extract-crosstabs" / "scripts" / "tabulate.py"
+_spec = importlib.util.spec_from_file_location("tabulate", TABULATE)
+tabulate = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(tabulate)
+
+
+def _ranked_config():
+    return {
+        "banners": [{"group_name": "Total", "variable": None, "values": [{"code": None, "label": "Total"}]}],
+        "weight_variable": None,
+        "questions": [
+            {
+                "question_id": "Q1",
+                "question_text": "Rank your top two",
+                "question_type": "ranked",
+                "variables": ["rank1", "rank2"],
+                "rank_positions": [1, 2],
+                "value_codes": [{"code": 1, "label": "Brand A"}, {"code": 2, "label": "Brand B"}],
+                "derived_measures": [{"type": "mean_rank"}],
+            }
+        ],
+    }
+
+
+def test_mean_rank_rounds_ties_like_np_average():
+    # Brand A: 253 respondents rank it 1st, 187 rank it 2nd -> mean rank 627/440.
+    # round(np.float64(627/440), 2) == 1.42, while round(627/440, 2) == 1.43.
+    n_first, n_second = 253, 187
+    df = pd.DataFrame({
+        "rank1": [1] * n_first + [2] * n_second,
+        "rank2": [2] * n_first + [1] * n_second,
+    })
+    config = _ranked_config()
+    weights = tabulate.get_weight_series(df, None)
+
+    rows = tabulate.tabulate_questions(df, weights, config)
+    mean_rank = {r["response_option"]: r["value"] for r in rows if r["row_type"] == "mean"}
+
+    expected = round(np.average([1] * n_first + [2] * n_second), 2)
+    assert expected == 1.42
+    assert mean_rank["Brand A — Mean rank"] == expected
+
+
+def _mean_flat(cells):
+    """Flat rows for one mean question: cells are (banner_value, mean, sd, n) in one banner group."""
+    return pd.DataFrame([
+        {
+            "question_id": "Q2", "response_option": "Mean", "banner_group": "Region", "banner_value": value,
+            "value": mean, "value_type": "mean", "base_n": n, "sig_markers": None, tabulate.SD_COLUMN: sd,
+        }
+        for value, mean, sd, n in cells
+    ])
+
+
+def test_t_mean_markers_match_welch_t_tests():
+    from scipy.stats import ttest_ind_from_stats
+
+    cells = [("North", 3.9, 1.0, 200), ("South", 3.7, 1.1, 150), ("East", 3.2, 0.9, 40), ("West", 3.85, 2.5, 12)]
+    flat = tabulate.apply_significance_testing(
+        _mean_flat(cells), {"enabled": True, "test_type": "t_mean", "confidence_level": 0.95}
+    )
+
+    letters = "ABCD"
+    for i, (_, m1, s1, n1) in enumerate(cells):
+        expected = ""
+        for j, (_, m2, s2, n2) in enumerate(cells):
+            if i == j:
+                continue
+            t, p = ttest_ind_from_stats(m1, s1, n1, m2, s2, n2, equal_var=False)
+            if t > 0 and p < 0.05:
+                expected += letters[j]
+        assert (flat.loc[i, "sig_markers"] or "") == expected
+    # The fixture exercises both outcomes: North beats East, West (small n, wide sd) beats nobody
+    assert flat.loc[0, "sig_markers"] == "C"
+    assert flat.loc[3, "sig_markers"] is None
+
+
+def test_t_mean_skips_cells_without_sd_and_z_tests_leave_means_alone():
+    cells = [("North", 3.9, np.nan, 200), ("South", 3.3, 1.0, 150), ("East", 3.0, 1.0, 150)]
+    t_only = tabulate.apply_significance_testing(
+        _mean_flat(cells), {"enabled": True, "test_type": "t_mean", "confidence_level": 0.95}
+    )
+    assert t_only["sig_markers"].tolist() == [None, "C", None]
+
+    z_only = tabulate.apply_significance_testing(
+        _mean_flat(cells), {"enabled": True, "test_type": "z_proportion", "confidence_level": 0.95}
+    )
+    assert z_only["sig_markers"].isna().all()
@@ -0,0 +1,54 @@
+"""Regression fixtures for claude-skills/flatten-crosstab/scripts/validate.py."""
+
+import importlib.util
+from pathlib import Path
+
+import pandas as pd
+
+VALIDATE = Path(__file__).resolve().parents[1] / "claude-skills" / "flatten-crosstab" / "scripts" / "validate.py"
+_spec = importlib.util.spec_from_file_location("validate", VALIDATE)
+validate = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(validate)
+
+
+def _bad_sums_flat(question_ids, banner_values):
+    """Two response rows per question × banner value, summing to 90 so every cut is flagged."""
+    return pd.DataFrame([
+        {
+            "question_id": qid, "question_text": f"Question {qid}", "row_type": "response",
+            "response_option": option, "banner_group": "Region", "banner_value": bv,
+            "value": 45.0, "value_type": "percent", "base_n": 100,
+        }
+        for qid in question_ids
+        for bv in banner_values
+        for option in ("Yes", "No")
+    ])
+
+
+def test_numeric_codes_are_reported_in_numeric_order(tmp_path):
+    flat_path = tmp_path / "flat.csv"
+    _bad_sums_flat([10, 2, 11, 1], [10, 2]).to_csv(flat_path, index=False)
+    scan = validate.FlatScan.from_file(flat_path, chunksize=5)
+
+    details = [issue["detail"] for issue in validate.check_percentage_sums(scan)["issues"]]
+    # Same order as the baseline's groupby on read_csv's integer columns: 2 before 10
+    assert [d.split(":")[0] for d in details] == [
+        f"{qid} × Region × {bv}" for qid in (1, 2, 10, 11) for bv in (2, 10)
+    ]
+
+    plan = pd.DataFrame({"banner_group": ["Region"] * 3, "banner_value": ["10", "9", "100"], "base_n": [100] * 3})
+    completeness = validate.check_completeness(scan, plan)["issues"]
+    assert [issue["detail"] for issue in completeness] == [
+        "Missing from output: Region × 9",
+        "Missing from output: Region × 100",
+        "Present in output but not in banner plan: Region × 2",
+    ]
+
+
+def test_text_codes_keep_text_order(tmp_path):
+    flat_path = tmp_path / "flat.csv"
+    _bad_sums_flat(["Q10", "Q2"], ["B"]).to_csv(flat_path, index=False)
+    scan = validate.FlatScan.from_file(flat_path)
+
+    details = [issue["detail"] for issue in validate.check_percentage_sums(scan)["issues"]]
+    assert [d.split(":")[0] for d in details] == ["Q10 × Region × B", "Q2 × Region × B"]